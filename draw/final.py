@@ -1,4 +1,8 @@
 from time import time, sleep
+from collections import deque
+import threading
+import numpy as np
+import bpy
 from ..bin import pyluxcore
 from .. import utils
 from ..export.aovs import get_denoiser_imgpipeline_props
@@ -36,6 +40,113 @@ DEFAULT_AOV_SETTINGS = AOV(3, pyluxcore.ConvertFilmChannelOutput_3xFloat_To_3xFl
 
 AOVS_WITH_ID = {"RADIANCE_GROUP", "BY_MATERIAL_ID", "BY_OBJECT_ID", "MATERIAL_ID_MASK", "OBJECT_ID_MASK"}
 
+# AOVs containing geometry information that does not change anymore after a few samples.
+# They are imported until STATIC_AOV_SAMPLES are reached, then they are frozen.
+STATIC_AOVS = {
+    "DEPTH", "POSITION", "SHADING_NORMAL", "AVG_SHADING_NORMAL", "GEOMETRY_NORMAL", "UV",
+    "MATERIAL_ID", "MATERIAL_ID_COLOR", "OBJECT_ID",
+}
+STATIC_AOV_SAMPLES = 4
+
+# The automatic denoiser refresh runs the first time at this sample count, the following
+# runs when the sample count has grown by the configured factor
+DENOISER_AUTO_REFRESH_MIN_SAMPLES = 16
+
+# AOVs that have to be read with GetOutputUInt() by the readback worker
+UINT_AOVS = {"MATERIAL_ID", "OBJECT_ID", "SAMPLECOUNT"}
+
+
+class Readback:
+    """ Storage class for everything needed to copy one film output into a Blender pass """
+    def __init__(self, pass_name, output_type, index, channel_count, normalize, is_uint, execute_imagepipeline,
+                 pass_channel_count=None):
+        self.pass_name = pass_name
+        self.output_type = output_type
+        self.index = index
+        self.channel_count = channel_count
+        self.normalize = normalize
+        self.is_uint = is_uint
+        self.execute_imagepipeline = execute_imagepipeline
+        # Channel count of the Blender pass, the film output is padded if it has less channels
+        self.pass_channel_count = channel_count if pass_channel_count is None else pass_channel_count
+
+
+class FilmReadbackWorker(threading.Thread):
+    """
+    Reads film outputs into staging arrays on a background thread, so the render loop
+    does not stall behind the film conversion of huge images. The staging area is
+    double-buffered: the worker can fill one buffer while the other still holds a
+    finished frame. The render result may only be touched by the main thread,
+    see FrameBufferFinal.publish().
+    """
+    def __init__(self, framebuffer, session):
+        super().__init__(daemon=True)
+        self._framebuffer = framebuffer
+        self._session = session
+        self._lock = threading.Lock()
+        self._job_event = threading.Event()
+        self._idle_event = threading.Event()
+        self._idle_event.set()
+        self._stop_event = threading.Event()
+        self._job = None
+        # Two sets of staging arrays, {pass_name: numpy array}
+        self._staging = [{}, {}]
+        self._back = 0
+        # (readbacks, staging, duration) of the last finished job that was not yet published
+        self._finished = None
+
+    def submit(self, readbacks):
+        """ Returns False if the worker is still busy with the last job """
+        with self._lock:
+            if not self._idle_event.is_set():
+                return False
+            self._job = readbacks
+            self._idle_event.clear()
+        self._job_event.set()
+        return True
+
+    def is_busy(self):
+        return not self._idle_event.is_set()
+
+    def wait_until_idle(self):
+        self._idle_event.wait()
+
+    def take_finished(self):
+        with self._lock:
+            finished = self._finished
+            self._finished = None
+        return finished
+
+    def stop(self):
+        self._stop_event.set()
+        self._job_event.set()
+        self.join()
+
+    def run(self):
+        while True:
+            self._job_event.wait()
+            self._job_event.clear()
+            if self._stop_event.is_set():
+                break
+
+            start = time()
+            staging = self._staging[self._back]
+            for readback in self._job:
+                try:
+                    # Locked per output, so the render loop can access the session between outputs
+                    with self._framebuffer.film_lock:
+                        staging[readback.pass_name] = self._framebuffer.read_output(self._session, readback,
+                                                                                    staging.get(readback.pass_name))
+                except RuntimeError as error:
+                    print("Error on readback of pass %s: %s" % (readback.pass_name, error))
+
+            with self._lock:
+                # A newer frame replaces an older one that was not published yet
+                self._finished = (self._job, staging, time() - start)
+                self._back = 1 - self._back
+                self._job = None
+                self._idle_event.set()
+
 
 class FrameBufferFinal(object):
     """ FrameBuffer for final render """
@@ -57,12 +168,64 @@ class FrameBufferFinal(object):
         # How long the last run of the denoiser took, in seconds
         self.denoiser_last_elapsed_time = 0
         self.denoiser_last_samples = 0
-
-    def draw(self, engine, session, scene, render_stopped):
+        self.denoiser_last_convergence = 0
+        # When the last denoiser run ended, used to limit the overhead of automatic refreshes
+        self._denoiser_last_end = 0
+
+        # The render result is kept open during the whole render and only ended when the
+        # render stops. This way, passes that are not refreshed keep their last content.
+        self._result = None
+        # Sample count of each pass at the time of its last import, {pass_key: samples}
+        self._pass_samples = {}
+        self._last_aov_refresh = 0
+
+        # Film readback on a background thread, only used in final render
+        self._worker = None
+        # Held by every thread that accesses the film of the session (readback worker, render loop,
+        # checkpoint writer), LuxCore does not support concurrent film reads and session updates
+        self.film_lock = threading.Lock()
+        # If an imagepipeline change could not be submitted because the worker was busy
+        self._pending_force = False
+
+        # Measured durations as (task, seconds, is_complete_run), collected by the refresh scheduler
+        self._costs = deque(maxlen=64)
+        self._denoiser_time = 0
+
+    def pop_costs(self):
+        costs = list(self._costs)
+        self._costs.clear()
+        return costs
+
+    def draw(self, engine, session, scene, render_stopped, force_aov_refresh=False):
+        """
+        The combined pass is refreshed on every call. Auxiliary passes (AOVs, light groups)
+        are refreshed in the interval set in the display settings, and only if new samples
+        were rendered since their last import. Static AOVs (see STATIC_AOVS) are frozen
+        once they reach STATIC_AOV_SAMPLES.
+        """
+        if self._worker:
+            # Publish the last frame of the worker before the new one is drawn
+            self._worker.wait_until_idle()
+            self.publish(engine, scene)
+            if render_stopped:
+                self.stop_worker()
+            force_aov_refresh |= self._pending_force
+            self._pending_force = False
+
+        start = time()
+        denoiser_time = self._denoiser_time
+        with self.film_lock:
+            self._draw(engine, session, scene, render_stopped, force_aov_refresh)
+        # The denoiser is measured separately
+        self._costs.append(("film", time() - start - (self._denoiser_time - denoiser_time), True))
+
+    def _draw(self, engine, session, scene, render_stopped, force_aov_refresh):
         active_layer = utils_view_layer.State.active_view_layer
         scene_layer_name = scene.view_layers[active_layer].name if active_layer else ""
 
-        result = engine.begin_result(0, 0, self._width, self._height, layer=scene_layer_name)
+        if self._result is None:
+            self._result = engine.begin_result(0, 0, self._width, self._height, layer=scene_layer_name)
+        result = self._result
         # Regardless of the scene render layers, the result always only contains one layer
         render_layer = result.layers[0]
 
@@ -72,36 +235,79 @@ class FrameBufferFinal(object):
 
         # Import AOVs only in final render, not in material preview mode
         if not engine.is_preview:
-            for output_name, output_type in pyluxcore.FilmOutputType.names.items():
-                # Check if this AOV is enabled on this render layer
-                scene_layer = scene.view_layers[active_layer]
-                if getattr(scene_layer.luxcore.aovs, output_name.lower(), False):
-                    try:
-                        self._import_aov(output_name, output_type, render_layer, session, engine)
-                    except RuntimeError as error:
-                        print("Error on import of AOV %s: %s" % (output_name, error))
-
-            lightgroup_pass_names = scene.luxcore.lightgroups.get_pass_names()
-            for i, name in enumerate(lightgroup_pass_names):
-                if i not in engine.exporter.lightgroup_cache:
-                    # This light group is not used by any lights in the scene, so it was not defined
-                    continue
-
-                output_name = "RADIANCE_GROUP"
-                output_type = pyluxcore.FilmOutputType.RADIANCE_GROUP
-                try:
-                    self._import_aov(output_name, output_type, render_layer, session, engine, True, i, name)
-                except RuntimeError as error:
-                    print("Error on import of Lightgroup AOV of group %s: %s" % (name, error))
+            samples = session.GetStats().Get("stats.renderengine.pass").GetInt()
+
+            if self._refresh_aovs_now(scene, render_stopped, force_aov_refresh):
+                self._import_aovs(engine, session, scene, render_layer, samples, force_aov_refresh)
 
             self._refresh_denoiser(engine, session, scene, render_layer, render_stopped)
 
-        engine.end_result(result)
+        if render_stopped:
+            engine.end_result(result)
+            self._result = None
+        else:
+            engine.update_result(result)
+
         # Reset the refresh button
         LuxCoreDisplaySettings.refresh = False
 
-    def _import_aov(self, output_name, output_type, render_layer, session, engine,
-                    execute_imagepipeline=True, index=0, lightgroup_name=""):
+    def _refresh_aovs_now(self, scene, render_stopped, force_aov_refresh):
+        now = time()
+        aov_interval = scene.luxcore.display.aov_interval
+        refresh_aovs = (render_stopped or force_aov_refresh or LuxCoreDisplaySettings.refresh
+                        or now - self._last_aov_refresh >= aov_interval)
+        if refresh_aovs:
+            self._last_aov_refresh = now
+        return refresh_aovs
+
+    def _needs_import(self, pass_key, output_name, samples, force):
+        last_samples = self._pass_samples.get(pass_key, -1)
+
+        if output_name in STATIC_AOVS and last_samples >= STATIC_AOV_SAMPLES:
+            # Frozen, geometry information does not change with more samples
+            return False
+        # Skip passes without new samples, except if e.g. the imagepipeline was edited
+        return force or samples != last_samples
+
+    def _import_aovs(self, engine, session, scene, render_layer, samples, force):
+        active_layer = utils_view_layer.State.active_view_layer
+        scene_layer = scene.view_layers[active_layer]
+
+        for output_name, output_type in pyluxcore.FilmOutputType.names.items():
+            # Check if this AOV is enabled on this render layer
+            if not getattr(scene_layer.luxcore.aovs, output_name.lower(), False):
+                continue
+            if not self._needs_import(output_name, output_name, samples, force):
+                continue
+
+            try:
+                self._import_aov(output_name, output_type, render_layer, session, engine)
+                self._pass_samples[output_name] = samples
+            except RuntimeError as error:
+                print("Error on import of AOV %s: %s" % (output_name, error))
+
+        lightgroup_pass_names = scene.luxcore.lightgroups.get_pass_names()
+        for i, name in enumerate(lightgroup_pass_names):
+            if i not in engine.exporter.lightgroup_cache:
+                # This light group is not used by any lights in the scene, so it was not defined
+                continue
+
+            output_name = "RADIANCE_GROUP"
+            pass_key = output_name + str(i)
+            if not self._needs_import(pass_key, output_name, samples, force):
+                continue
+
+            output_type = pyluxcore.FilmOutputType.RADIANCE_GROUP
+            try:
+                self._import_aov(output_name, output_type, render_layer, session, engine, True, i, name)
+                self._pass_samples[pass_key] = samples
+            except RuntimeError as error:
+                print("Error on import of Lightgroup AOV of group %s: %s" % (name, error))
+
+    def _resolve_aov(self, output_name, output_type, engine, index, lightgroup_name):
+        """
+        Returns a tuple (aov, convert_func, output_type, index, pass_name, is_pipeline_output)
+        """
         if output_name in AOVS:
             aov = AOVS[output_name]
         else:
@@ -111,7 +317,8 @@ class FrameBufferFinal(object):
             # Add the index so we can differentiate between the outputs with id
             output_name += str(index)
 
-        if output_name in engine.aov_imagepipelines:
+        is_pipeline_output = output_name in engine.aov_imagepipelines
+        if is_pipeline_output:
             index = engine.aov_imagepipelines[output_name]
             
             if output_name == "DENOISED" and self._transparent:
@@ -131,6 +338,12 @@ class FrameBufferFinal(object):
         else:
             pass_name = output_name
 
+        return aov, convert_func, output_type, index, pass_name, is_pipeline_output
+
+    def _import_aov(self, output_name, output_type, render_layer, session, engine,
+                    execute_imagepipeline=True, index=0, lightgroup_name=""):
+        aov, convert_func, output_type, index, pass_name, _ = self._resolve_aov(output_name, output_type, engine,
+                                                                                index, lightgroup_name)
         blender_pass = render_layer.passes[pass_name]
 
         # Convert and copy the buffer into the blender_pass.rect
@@ -149,11 +362,33 @@ class FrameBufferFinal(object):
         else:
             output_type = pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE
 
+        if self._run_denoiser(engine, session, scene, render_stopped):
+            try:
+                # Import the denoised image without executing the imagepipeline again
+                self._import_aov(output_name, output_type, render_layer, session, engine,
+                                 execute_imagepipeline=False)
+            except RuntimeError as error:
+                print("Error on import of denoised result: %s" % error)
+        elif self.denoiser_last_samples == 0:
+            # If we do not write something into the result, the image will be black.
+            # So we import the (not yet denoised) output once. Later results from
+            # denoiser runs stay in the render result, which is kept open.
+            self._import_aov(output_name, output_type, render_layer, session, engine,
+                             execute_imagepipeline=False)
+
+    def _run_denoiser(self, engine, session, scene, render_stopped):
+        """ Returns True if the denoiser imagepipeline was executed """
+        output_name = engine.DENOISED_OUTPUT_NAME
+
         # Refresh when ending the render (Esc/halt condition) or when the user presses the refresh button
         refresh_denoised = render_stopped or LuxCoreDenoiser.refresh
 
         stats = engine.session.GetStats()
         samples = stats.Get("stats.renderengine.pass").GetInt()
+        convergence = stats.Get("stats.renderengine.convergence").GetFloat()
+
+        if not refresh_denoised and self._needs_automatic_denoiser_refresh(scene, samples, convergence):
+            refresh_denoised = True
 
         if render_stopped and samples == self.denoiser_last_samples:
             # No new samples, do not run the denoiser. Saves time when the user
@@ -164,6 +399,7 @@ class FrameBufferFinal(object):
         if refresh_denoised:
             print("Refreshing DENOISED")
             self.denoiser_last_samples = samples
+            self.denoiser_last_convergence = convergence
 
             # Update the imagepipeline
             denoiser_pipeline_index = engine.aov_imagepipelines[output_name]
@@ -187,13 +423,13 @@ class FrameBufferFinal(object):
                     engine.update_stats("Denoising...", msg)
                     sleep(1)
 
-                self.denoiser_last_elapsed_time = round(time() - start)
-
-                # Import the denoised image without executing the imagepipeline again
-                self._import_aov(output_name, output_type, render_layer, session, engine,
-                                 execute_imagepipeline=False)
+                elapsed = time() - start
+                self._denoiser_last_end = time()
+                self._denoiser_time += elapsed
+                self._costs.append(("denoiser", elapsed, True))
+                self.denoiser_last_elapsed_time = round(elapsed)
             except RuntimeError as error:
-                print("Error on import of denoised result: %s" % error)
+                print("Error during denoising: %s" % error)
 
             if not was_paused and session.IsInPause():
                 session.Resume()
@@ -204,8 +440,191 @@ class FrameBufferFinal(object):
             # Reset the refresh button
             LuxCoreDenoiser.refresh = False
             engine.update_stats("Denoiser Done", "Elapsed: {} s".format(elapsed))
+
+        return refresh_denoised
+
+    def _needs_automatic_denoiser_refresh(self, scene, samples, convergence):
+        """
+        Re-run the denoiser when the sample count has grown by the configured factor or the
+        convergence has improved by the configured step since the last run. To limit the overhead,
+        the time since the last run has to be long enough compared to the duration of that run.
+        """
+        denoiser = scene.luxcore.denoiser
+        if not denoiser.auto_refresh or samples == 0:
+            return False
+
+        min_pause = self.denoiser_last_elapsed_time / (denoiser.auto_refresh_max_overhead / 100)
+        if time() - self._denoiser_last_end < min_pause:
+            return False
+
+        if samples < DENOISER_AUTO_REFRESH_MIN_SAMPLES:
+            # Denoising the first few samples is a waste of time
+            return False
+
+        samples_grown = samples >= self.denoiser_last_samples * denoiser.auto_refresh_sample_factor
+        convergence_improved = (convergence - self.denoiser_last_convergence
+                                >= denoiser.auto_refresh_convergence_step / 100)
+        return samples_grown or convergence_improved
+
+    def _collect_readbacks(self, engine, session, scene, samples, render_stopped, force_aov_refresh):
+        """
+        The render result is kept open, so only passes that need a refresh are included.
+        """
+        combined_channels = 4 if self._transparent else 3
+        readbacks = [Readback("Combined", self._combined_output_type, 0, combined_channels, False, False, True,
+                              pass_channel_count=4)]
+
+        active_layer = utils_view_layer.State.active_view_layer
+        scene_layer = scene.view_layers[active_layer]
+        refresh_aovs = self._refresh_aovs_now(scene, render_stopped, force_aov_refresh)
+
+        def add(output_name, output_type, pass_key, index=0, lightgroup_name="", execute=None):
+            aov, _, output_type, index, pass_name, is_pipeline = self._resolve_aov(output_name, output_type, engine,
+                                                                                   index, lightgroup_name)
+            if execute is None:
+                # The AOVs are only imported when a refresh is due (see draw())
+                if not (refresh_aovs and self._needs_import(pass_key, output_name, samples, force_aov_refresh)):
+                    return
+                self._pass_samples[pass_key] = samples
+                execute = True
+
+            if is_pipeline:
+                channel_count = 4 if output_type == pyluxcore.FilmOutputType.RGBA_IMAGEPIPELINE else 3
+                readbacks.append(Readback(pass_name, output_type, index, channel_count, False, False, execute))
+            else:
+                # We need to pad the UV pass to 3 elements (Blender can't handle 2 elements)
+                pass_channel_count = 3 if output_name == "UV" else aov.channel_count
+                readbacks.append(Readback(pass_name, output_type, index, aov.channel_count, aov.normalize,
+                                          output_name in UINT_AOVS, execute, pass_channel_count))
+
+        for output_name, output_type in pyluxcore.FilmOutputType.names.items():
+            # Check if this AOV is enabled on this render layer
+            if getattr(scene_layer.luxcore.aovs, output_name.lower(), False):
+                add(output_name, output_type, output_name)
+
+        lightgroup_pass_names = scene.luxcore.lightgroups.get_pass_names()
+        for i, name in enumerate(lightgroup_pass_names):
+            if i not in engine.exporter.lightgroup_cache:
+                # This light group is not used by any lights in the scene, so it was not defined
+                continue
+            add("RADIANCE_GROUP", pyluxcore.FilmOutputType.RADIANCE_GROUP, "RADIANCE_GROUP" + str(i), i, name)
+
+        if engine.has_denoiser():
+            denoised = self._run_denoiser(engine, session, scene, render_stopped)
+            if denoised or self.denoiser_last_samples == 0:
+                # Never execute the denoiser imagepipeline here, it is only run by _run_denoiser()
+                add(engine.DENOISED_OUTPUT_NAME, pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE,
+                    engine.DENOISED_OUTPUT_NAME, execute=False)
+
+        return readbacks
+
+    def _get_output(self, session, readback, buffer, execute_imagepipeline):
+        """ Fill the flat float32 buffer with a film output, returns it as (height, width, channels) array """
+        film = session.GetFilm()
+        if readback.is_uint:
+            film.GetOutputUInt(readback.output_type, buffer.view(np.uint32), readback.index, execute_imagepipeline)
+            # Convert the uint values to float in-place
+            buffer[:] = buffer.view(np.uint32)
         else:
-            # If we do not write something into the result, the image will be black.
-            # So we re-use the result from the last denoiser run.
-            self._import_aov(output_name, output_type, render_layer, session, engine,
-                             execute_imagepipeline=False)
+            film.GetOutputFloat(readback.output_type, buffer, readback.index, execute_imagepipeline)
+
+        pixels = buffer.reshape(self._height, self._width, readback.channel_count)
+        if readback.normalize:
+            max_value = pixels.max()
+            if max_value > 0:
+                pixels /= max_value
+        return pixels
+
+    # Background readback (final render)
+
+    def start_worker(self, session):
+        if bpy.app.version < (2, 83, 0):
+            # publish() needs foreach_set() on the pass rect, which is only available since Blender 2.83.
+            # Without the worker, request_draw() falls back to the blocking draw().
+            return
+        self._worker = FilmReadbackWorker(self, session)
+        self._worker.start()
+
+    def stop_worker(self):
+        if self._worker:
+            self._worker.stop()
+            self._worker = None
+
+    def close(self, engine):
+        """ Stop the worker and end the render result that is kept open between refreshes, e.g. after an error """
+        self.stop_worker()
+        if self._result is not None:
+            engine.end_result(self._result)
+            self._result = None
+
+    def read_output(self, session, readback, staging):
+        """
+        Called from the worker thread. Returns a (height, width, pass channels) array that can be
+        copied into the Blender pass as-is. The staging array is re-used if possible.
+        """
+        shape = (self._height, self._width, readback.pass_channel_count)
+        if staging is None or staging.shape != shape:
+            staging = np.empty(shape, dtype=np.float32)
+
+        if readback.channel_count == readback.pass_channel_count:
+            # Read directly into the staging array
+            self._get_output(session, readback, staging.reshape(-1), readback.execute_imagepipeline)
+        else:
+            buffer = np.empty(self._width * self._height * readback.channel_count, dtype=np.float32)
+            pixels = self._get_output(session, readback, buffer, readback.execute_imagepipeline)
+            staging[:, :, :readback.channel_count] = pixels
+            staging[:, :, readback.channel_count:] = 1
+        return staging
+
+    def request_draw(self, engine, session, scene, force_aov_refresh=False):
+        """
+        Hand a film refresh to the background worker. Falls back to a blocking draw() if
+        the worker is not running. Returns False if the worker is still busy.
+        """
+        if not self._worker:
+            self.draw(engine, session, scene, render_stopped=False, force_aov_refresh=force_aov_refresh)
+            return True
+
+        if self._worker.is_busy():
+            self._pending_force |= force_aov_refresh
+            return False
+
+        start = time()
+        denoiser_time = self._denoiser_time
+        force_aov_refresh |= self._pending_force
+        self._pending_force = False
+        samples = session.GetStats().Get("stats.renderengine.pass").GetInt()
+        with self.film_lock:
+            # Might run the denoiser imagepipeline
+            readbacks = self._collect_readbacks(engine, session, scene, samples, False, force_aov_refresh)
+        self._worker.submit(readbacks)
+        # Only a part of the film refresh, the rest is measured by the worker and in publish()
+        self._costs.append(("film", time() - start - (self._denoiser_time - denoiser_time), False))
+        # Reset the refresh button
+        LuxCoreDisplaySettings.refresh = False
+        return True
+
+    def publish(self, engine, scene):
+        """ Copy the last frame finished by the worker into the render result. Returns True if there was one """
+        finished = self._worker.take_finished() if self._worker else None
+        if finished is None:
+            return False
+
+        start = time()
+
+        if self._result is None:
+            active_layer = utils_view_layer.State.active_view_layer
+            scene_layer_name = scene.view_layers[active_layer].name if active_layer else ""
+            self._result = engine.begin_result(0, 0, self._width, self._height, layer=scene_layer_name)
+        render_layer = self._result.layers[0]
+
+        readbacks, staging, readback_duration = finished
+        for readback in readbacks:
+            pixels = staging.get(readback.pass_name)
+            if pixels is not None:
+                render_layer.passes[readback.pass_name].rect.foreach_set(pixels.ravel())
+
+        engine.update_result(self._result)
+        self._costs.append(("film", readback_duration + time() - start, True))
+        return True
+
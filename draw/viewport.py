@@ -2,6 +2,7 @@ import bgl
 import math
 import os
 import numpy
+import platform
 import subprocess
 import tempfile
 from shutil import which
@@ -12,6 +13,30 @@ from ..utils import pfm
 
 NULL = 0
 
+# Film outputs passed to the denoiser, with the name of their file
+DENOISER_INPUTS = (
+    ("noisy", pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE),
+    ("albedo", pyluxcore.FilmOutputType.ALBEDO),
+    ("normal", pyluxcore.FilmOutputType.AVG_SHADING_NORMAL),
+)
+
+
+def _denoiser_tempdir():
+    # Prefer a RAM-backed filesystem on Linux, the files are written and read on every denoiser run
+    if platform.system() == "Linux":
+        shm = "/dev/shm"
+        if os.path.isdir(shm) and os.access(shm, os.W_OK):
+            return shm
+    return tempfile.gettempdir()
+
+
+def _numpy_view(buffer, dtype):
+    """ Numpy view of a bgl.Buffer without copy, or None if the buffer protocol is not supported """
+    try:
+        return numpy.frombuffer(buffer, dtype=dtype)
+    except (TypeError, ValueError):
+        return None
+
 
 class TempfileManager:
     _paths = {}
@@ -49,6 +74,7 @@ class FrameBuffer(object):
         self._border = utils.calc_blender_border(scene, context)
         self._offset_x, self._offset_y = self._calc_offset(context, scene, self._border)
         self._pixel_size = int(scene.luxcore.viewport.pixel_size)
+        self._half_float = scene.luxcore.viewport.use_half_float
 
         if utils.is_valid_camera(scene.camera) and not utils.in_material_shading_mode(context):
             pipeline = scene.camera.data.luxcore.imagepipeline
@@ -66,13 +92,35 @@ class FrameBuffer(object):
             self._output_type = pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE
 
         self.buffer = bgl.Buffer(bgl.GL_FLOAT, [self._width * self._height * bufferdepth])
+        # Numpy view of the buffer, without copy. Not available in Blender versions where
+        # bgl.Buffer does not support the buffer protocol, the data is copied into the buffer then.
+        self._buffer_view = _numpy_view(self.buffer, numpy.float32)
+        if self._buffer_view is not None:
+            self._buffer_view = self._buffer_view.reshape(self._height, self._width, bufferdepth)
+
+        self._upload_view = None
+        if self._half_float and self._buffer_view is not None:
+            # bgl has no half float type, so a short buffer of the same size is used as storage
+            self._upload_buffer = bgl.Buffer(bgl.GL_SHORT, [self._width * self._height * bufferdepth])
+            self._upload_view = _numpy_view(self._upload_buffer, numpy.float16)
+
+        if self._upload_view is not None:
+            self._upload_type = bgl.GL_HALF_FLOAT
+            self._upload_size = self._width * self._height * bufferdepth * 2
+        else:
+            # Half float conversion needs numpy views of the buffers
+            self._upload_buffer = self.buffer
+            self._upload_type = bgl.GL_FLOAT
+            self._upload_size = self._width * self._height * bufferdepth * 4
+
         self._init_opengl(engine, scene)
 
         # Denoiser
-        self._noisy_file_path = self._make_denoiser_filepath("noisy")
-        self._albedo_file_path = self._make_denoiser_filepath("albedo")
-        self._normal_file_path = self._make_denoiser_filepath("normal")
+        self._denoiser_input_paths = {name: self._make_denoiser_filepath(name) for name, _ in DENOISER_INPUTS}
         self._denoised_file_path = self._make_denoiser_filepath("denoised")
+        # Memory-mapped denoiser input files, created on the first denoiser run and re-used afterwards
+        self._denoiser_inputs = None
+        self._alpha = None
         current_dir = dirname(os.path.realpath(__file__))
         addon_dir = dirname(current_dir)  # Go up one level
         self._denoiser_path = which("oidnDenoise",
@@ -81,11 +129,32 @@ class FrameBuffer(object):
         self.denoiser_result_cached = False
 
     def _init_opengl(self, engine, scene):
-        # Create texture
+        # Create texture, its storage is allocated once and only refreshed in _update_texture()
         self.texture = bgl.Buffer(bgl.GL_INT, 1)
         bgl.glGenTextures(1, self.texture)
         self.texture_id = self.texture[0]
 
+        half_float = self._upload_type == bgl.GL_HALF_FLOAT
+        if self._transparent:
+            internal_format = bgl.GL_RGBA16F if half_float else bgl.GL_RGBA32F
+        else:
+            internal_format = bgl.GL_RGB16F if half_float else bgl.GL_RGB32F
+
+        bgl.glActiveTexture(bgl.GL_TEXTURE0)
+        bgl.glBindTexture(bgl.GL_TEXTURE_2D, self.texture_id)
+        bgl.glTexImage2D(bgl.GL_TEXTURE_2D, 0, internal_format, self._width, self._height,
+                         0, self._buffertype, self._upload_type, None)
+        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_WRAP_S, bgl.GL_CLAMP_TO_EDGE)
+        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_WRAP_T, bgl.GL_CLAMP_TO_EDGE)
+        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MIN_FILTER, bgl.GL_NEAREST)
+        bgl.glBindTexture(bgl.GL_TEXTURE_2D, NULL)
+
+        # Two pixel buffers, used alternately. While the GPU transfers one into the texture,
+        # the next frame can already be copied into the other one without waiting.
+        self.pixel_buffers = bgl.Buffer(bgl.GL_INT, 2)
+        bgl.glGenBuffers(2, self.pixel_buffers)
+        self._pixel_buffer_index = 0
+
         # Bind shader that converts from scene linear to display space,
         # use the scene's color management settings.
         engine.bind_display_space_shader(scene)
@@ -132,10 +201,14 @@ class FrameBuffer(object):
         engine.unbind_display_space_shader()
 
     def __del__(self):
+        bgl.glDeleteBuffers(2, self.pixel_buffers)
         bgl.glDeleteBuffers(2, self.vertex_buffer)
         bgl.glDeleteVertexArrays(1, self.vertex_array)
         bgl.glBindTexture(bgl.GL_TEXTURE_2D, 0)
         bgl.glDeleteTextures(1, self.texture)
+        # Close the memory maps before the files are deleted
+        self._denoiser_inputs = None
+        TempfileManager.delete_files(id(self))
 
     def needs_replacement(self, context, scene):
         if (self._width, self._height) != utils.calc_filmsize(scene, context):
@@ -154,37 +227,45 @@ class FrameBuffer(object):
             return True
         if self._pixel_size != int(scene.luxcore.viewport.pixel_size):
             return True
+        if self._half_float != scene.luxcore.viewport.use_half_float:
+            return True
         return False
 
     def _make_denoiser_filepath(self, name):
-        return os.path.join(tempfile.gettempdir(), str(id(self)) + "_" + name + ".pfm")
+        return os.path.join(_denoiser_tempdir(), str(id(self)) + "_" + name + ".pfm")
+
+    def _create_denoiser_inputs(self):
+        self._denoiser_inputs = {}
+        for name, _ in DENOISER_INPUTS:
+            path = self._denoiser_input_paths[name]
+            TempfileManager.track(id(self), path)
+            # Channels always 3 because denoiser can't handle alpha anyway, it is copied over from the film
+            self._denoiser_inputs[name] = utils.pfm.create_pfm_memmap(path, self._width, self._height)
 
-    def _save_denoiser_AOV(self, luxcore_session, film_output_type, path):
-        # Bufferdepth always 3 because denoiser can't handle alpha anyway (maybe copy over alpha channel in the future)
-        np_buffer = numpy.zeros((self._height, self._width, 3), dtype="float32")
-        luxcore_session.GetFilm().GetOutputFloat(film_output_type, np_buffer)
-        TempfileManager.track(id(self), path)
-        with open(path, "w+b") as f:
-            utils.pfm.save_pfm(f, np_buffer)
+        if self._transparent:
+            self._alpha = numpy.zeros((self._height, self._width, 1), dtype="float32")
 
     def start_denoiser(self, luxcore_session):
         if not os.path.exists(self._denoiser_path):
             raise Exception("Binary not found. Download it from "
                             "https://github.com/OpenImageDenoise/oidn/releases")
+        if self._denoiser_inputs is None:
+            self._create_denoiser_inputs()
+
+        film = luxcore_session.GetFilm()
         if self._transparent:
-            self._alpha = numpy.zeros((self._height, self._width, 1), dtype="float32")
-            luxcore_session.GetFilm().GetOutputFloat(pyluxcore.FilmOutputType.ALPHA, self._alpha)
+            film.GetOutputFloat(pyluxcore.FilmOutputType.ALPHA, self._alpha)
 
-        self._save_denoiser_AOV(luxcore_session, pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE, self._noisy_file_path)
-        self._save_denoiser_AOV(luxcore_session, pyluxcore.FilmOutputType.ALBEDO, self._albedo_file_path)
-        self._save_denoiser_AOV(luxcore_session, pyluxcore.FilmOutputType.AVG_SHADING_NORMAL, self._normal_file_path)
+        # The film outputs are written directly into the memory-mapped files
+        for name, output_type in DENOISER_INPUTS:
+            film.GetOutputFloat(output_type, self._denoiser_inputs[name])
         TempfileManager.track(id(self), self._denoised_file_path)
 
         args = [
             self._denoiser_path,
-            "-hdr", self._noisy_file_path,
-            "-alb", self._albedo_file_path,
-            "-nrm", self._normal_file_path,
+            "-hdr", self._denoiser_input_paths["noisy"],
+            "-alb", self._denoiser_input_paths["albedo"],
+            "-nrm", self._denoiser_input_paths["normal"],
             "-o", self._denoised_file_path,
         ]
         self._denoiser_process = subprocess.Popen(args)
@@ -197,21 +278,23 @@ class FrameBuffer(object):
 
     def load_denoiser_result(self, scene):
         self._denoiser_process = None
-        shape = (self._height * self._width * 3)
         try:
-            with open(self._denoised_file_path, "rb") as f:
-                data, scale = utils.pfm.load_pfm(f)
-            TempfileManager.delete_files(id(self))
+            data, scale = utils.pfm.open_pfm_memmap(self._denoised_file_path)
         except FileNotFoundError:
-            TempfileManager.delete_files(id(self))
             raise Exception("Denoising failed, check console for details")
 
-        if self._transparent:
-            shape = (self._height * self._width * 4)
-            data = numpy.concatenate((data,self._alpha), axis=2)
+        if self._buffer_view is not None:
+            # Copy straight into the texture buffer, the input files are kept for the next run
+            self._buffer_view[:, :, :3] = data
+            if self._transparent:
+                self._buffer_view[:, :, 3:] = self._alpha
+        else:
+            if self._transparent:
+                data = numpy.concatenate((data, self._alpha), axis=2)
+            self.buffer[:] = data.ravel()
+        del data
+        os.remove(self._denoised_file_path)
 
-        data = numpy.resize(data, shape)
-        self.buffer[:] = data
         self._update_texture(scene)
         self.denoiser_result_cached = True
 
@@ -253,21 +336,28 @@ class FrameBuffer(object):
             bgl.glDisable(bgl.GL_BLEND)
 
     def _update_texture(self, scene):
-        if self._transparent:
-            gl_format = bgl.GL_RGBA
-            internal_format = bgl.GL_RGBA32F
-        else:
-            gl_format = bgl.GL_RGB
-            internal_format = bgl.GL_RGB32F
+        if self._upload_view is not None:
+            self._upload_view[:] = self._buffer_view.reshape(-1)
+
+        pixel_buffer = self.pixel_buffers[self._pixel_buffer_index]
+        self._pixel_buffer_index = 1 - self._pixel_buffer_index
+
+        bgl.glBindBuffer(bgl.GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+        # Orphan the old storage, so the driver does not have to wait for a transfer that is still running
+        bgl.glBufferData(bgl.GL_PIXEL_UNPACK_BUFFER, self._upload_size, None, bgl.GL_STREAM_DRAW)
+        bgl.glBufferSubData(bgl.GL_PIXEL_UNPACK_BUFFER, 0, self._upload_size, self._upload_buffer)
 
         bgl.glActiveTexture(bgl.GL_TEXTURE0)
         bgl.glBindTexture(bgl.GL_TEXTURE_2D, self.texture_id)
-        bgl.glTexImage2D(bgl.GL_TEXTURE_2D, 0, internal_format, self._width, self._height,
-                         0, gl_format, bgl.GL_FLOAT, self.buffer)
-        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_WRAP_S, bgl.GL_CLAMP_TO_EDGE)
-        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_WRAP_T, bgl.GL_CLAMP_TO_EDGE)
+        # Rows are tightly packed. With half float RGB, a row of an odd width is not a multiple
+        # of the default alignment of 4 bytes.
+        bgl.glPixelStorei(bgl.GL_UNPACK_ALIGNMENT, 1)
+        # With a bound pixel buffer, the data argument is an offset into it and the transfer is asynchronous
+        bgl.glTexSubImage2D(bgl.GL_TEXTURE_2D, 0, 0, 0, self._width, self._height,
+                            self._buffertype, self._upload_type, None)
+        bgl.glPixelStorei(bgl.GL_UNPACK_ALIGNMENT, 4)
+        bgl.glBindBuffer(bgl.GL_PIXEL_UNPACK_BUFFER, NULL)
 
-        bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MIN_FILTER, bgl.GL_NEAREST)
         mag_filter = bgl.GL_NEAREST if scene.luxcore.viewport.mag_filter == "NEAREST" else bgl.GL_LINEAR
         bgl.glTexParameteri(bgl.GL_TEXTURE_2D, bgl.GL_TEXTURE_MAG_FILTER, mag_filter)
         bgl.glBindTexture(bgl.GL_TEXTURE_2D, NULL)
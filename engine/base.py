@@ -49,8 +49,11 @@ class LuxCoreRenderEngine(bpy.types.RenderEngine):
     def reset(self):
         self.framebuffer = None
         self.exporter = None
+        self.checkpoint_writer = None
         self.aov_imagepipelines = {}
         self.is_first_viewport_start = True
+        # If set, the viewport scene is exported in one go instead of staged
+        self.staged_export_failed = False
         self.viewport_start_time = 0
         self.starting_session = False
         self.viewport_starting_message_shown = False
@@ -102,9 +105,16 @@ class LuxCoreRenderEngine(bpy.types.RenderEngine):
             LuxCoreErrorLog.add_error(error_str)
 
             # Clean up
+            if self.framebuffer:
+                self.framebuffer.close(self)
+            if self.checkpoint_writer:
+                self.checkpoint_writer.stop(final_save=False)
             del self.session
             self.session = None
         finally:
+            if self.exporter:
+                # The exported scene was only kept for the following view layers
+                self.exporter.luxcore_scene = None
             utils_view_layer.State.reset()
             LuxCoreRenderEngine.final_running = False
             TileStats.reset()
@@ -117,6 +127,8 @@ class LuxCoreRenderEngine(bpy.types.RenderEngine):
             import traceback
             traceback.print_exc()
             # Clean up
+            if self.framebuffer:
+                self.framebuffer.close(self)
             del self.session
             self.session = None
 
@@ -4,6 +4,8 @@ from ..draw.final import FrameBufferFinal
 from ..utils import render as utils_render
 from ..utils.errorlog import LuxCoreErrorLog
 from ..utils import view_layer as utils_view_layer
+from ..utils import filesaver as utils_filesaver
+from ..utils import checkpoint as utils_checkpoint
 from ..properties.denoiser import LuxCoreDenoiser
 from ..properties.display import LuxCoreDisplaySettings
 
@@ -22,6 +24,8 @@ def render(engine, depsgraph):
             LuxCoreErrorLog.add_warning(msg)
 
     _check_halt_conditions(engine, scene)
+    # The scene exported for the first view layer is re-used by the following ones
+    exporter = None
 
     for layer_index, layer in enumerate(scene.view_layers):
         print('[Engine/Final] Rendering layer "%s"' % layer.name)
@@ -41,7 +45,7 @@ def render(engine, depsgraph):
         utils_view_layer.State.active_view_layer = layer.name
 
         _add_passes(engine, layer, scene)
-        _render_layer(engine, depsgraph, statistics, layer)
+        exporter = _render_layer(engine, depsgraph, statistics, layer, exporter)
 
         if _stop_requested(engine):
             # Blender skips the rest of the render layers anyway
@@ -50,16 +54,40 @@ def render(engine, depsgraph):
         print('[Engine/Final] Finished rendering layer "%s"' % layer.name)
     
 
-def _render_layer(engine, depsgraph, statistics, view_layer):
+def _render_layer(engine, depsgraph, statistics, view_layer, exporter=None):
+    """
+    Render one view layer. If the exporter of the previous layer is passed, its scene
+    is re-used if possible. Returns the exporter so the next layer can re-use it.
+    """
     engine.reset()
-    engine.exporter = export.Exporter(statistics)
-    engine.session = engine.exporter.create_session(depsgraph, engine=engine, view_layer=view_layer)
+    engine.session = None
+    checkpoint_path = utils_checkpoint.find_checkpoint(depsgraph.scene_eval, view_layer)
+
+    if checkpoint_path:
+        if exporter:
+            exporter.luxcore_scene = None
+        print('[Engine/Final] Resuming from checkpoint "%s"' % checkpoint_path)
+        engine.update_stats("Export", "Loading checkpoint...")
+        # The checkpoint contains the scene and config, the exporter only restores the
+        # AOV and light group state and applies the current imagepipeline and halt conditions
+        engine.exporter = export.Exporter(statistics)
+        engine.session = utils_checkpoint.load_session(checkpoint_path, engine.exporter, depsgraph, engine)
+    elif exporter:
+        engine.exporter = exporter
+        engine.session = exporter.create_session_for_view_layer(depsgraph, engine, view_layer)
+
+    if engine.session is None:
+        if exporter:
+            # Release the old scene before exporting the new one
+            exporter.luxcore_scene = None
+        engine.exporter = export.Exporter(statistics)
+        engine.session = engine.exporter.create_session(depsgraph, engine=engine, view_layer=view_layer)
     scene = depsgraph.scene_eval
 
     if engine.session is None:
         # session is None, but no error was thrown
         print("[Engine/Final] Export cancelled by user.")
-        return
+        return None
 
     engine.framebuffer = FrameBufferFinal(scene)
 
@@ -79,17 +107,19 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
             output_path = config.GetProperties().Get("filesaver.filename").GetString()
         else:
             output_path = config.GetProperties().Get("filesaver.directory").GetString()
+
+            if scene.luxcore.config.filesaver_share_payloads:
+                payload_count, saved_bytes = utils_filesaver.deduplicate_frame(output_path)
+                print("[Engine/Final] Moved %d files to the shared directory, %.1f MiB were already there"
+                      % (payload_count, saved_bytes / (1024 * 1024)))
         engine.report({"INFO"}, 'Exported to "%s"' % output_path)
 
         # Clean up
         del engine.session
         engine.session = None
-        return
+        return engine.exporter
 
-    start = time()
     path_settings = scene.luxcore.config.path
-    last_film_refresh = 0
-    last_stat_refresh = 0
     checked_optimal_clamp = path_settings.use_clamping
     engine_type = config.GetProperties().Get("renderengine.type").GetString()
     if engine_type.startswith("TILE"):
@@ -98,15 +128,31 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
         clamp_warmup_samples = aa**2 - epsilon
     else:
         clamp_warmup_samples = 2.0
-    stats = utils_render.update_stats(engine.session)
-    FAST_REFRESH_DURATION = 1 if engine.is_animation else 5
+    # Decides when to update stats and film, based on the measured cost of these operations
+    scheduler = utils_render.RefreshScheduler(scene, statistics)
+    stats = _update_stats(engine, scheduler)
+    # Film conversion runs on a background thread, the loop only copies finished frames into the result
+    engine.framebuffer.start_worker(engine.session)
+
+    checkpoint_path = utils_checkpoint.get_checkpoint_path(scene, view_layer)
+    if scene.luxcore.config.use_checkpoints and not checkpoint_path:
+        LuxCoreErrorLog.add_warning("Checkpoints: save the .blend file or set a checkpoint path")
+    elif scene.luxcore.config.use_checkpoints:
+        interval = scene.luxcore.config.checkpoint_interval * 60
+        engine.checkpoint_writer = utils_checkpoint.CheckpointWriter(engine.session, checkpoint_path, interval,
+                                                                     engine.framebuffer.film_lock)
+        engine.checkpoint_writer.start()
 
     while True:
+        engine.framebuffer.publish(engine, depsgraph.scene)
+        _collect_costs(engine, scheduler)
+
         now = time()
         manual_refresh_requested = LuxCoreDisplaySettings.refresh or LuxCoreDenoiser.refresh
-        update_stats = (now - last_stat_refresh) > _stat_refresh_interval(start, scene)
-        time_until_film_refresh = depsgraph.scene.luxcore.display.interval - (now - last_film_refresh)
-        fast_refresh = now - start < FAST_REFRESH_DURATION
+        # The user might change the interval during the render
+        scheduler.user_film_interval = depsgraph.scene.luxcore.display.interval
+        update_stats = scheduler.time_until_stats_refresh(now) <= 0
+        time_until_film_refresh = scheduler.time_until_film_refresh(now)
 
         if LuxCoreDisplaySettings.paused:
             if not engine.session.IsInPause():
@@ -120,21 +166,23 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
 
         # Do session update (imagepipeline, lightgroups)
         changes = engine.exporter.get_changes(depsgraph)
-        engine.exporter.update_session(changes, engine.session)
+        with engine.framebuffer.film_lock:
+            engine.exporter.update_session(changes, engine.session)
 
         if engine.session.IsInPause():
             if changes or manual_refresh_requested:
-                engine.framebuffer.draw(engine, engine.session, depsgraph.scene, render_stopped=False)
+                engine.framebuffer.draw(engine, engine.session, depsgraph.scene, render_stopped=False,
+                                        force_aov_refresh=bool(changes))
         else:
-            if fast_refresh or update_stats or changes or manual_refresh_requested or (time_until_film_refresh <= 0):
+            if update_stats or changes or manual_refresh_requested or (time_until_film_refresh <= 0):
                 # We have to check the stats often to see if a halt condition is met
                 # But film drawing is expensive, so we don't do it every time we check stats
-                draw_film = fast_refresh or (time_until_film_refresh <= 0)
+                draw_film = time_until_film_refresh <= 0
 
                 # Refresh quickly when user changed something or requested a refresh via button
                 draw_film |= changes or manual_refresh_requested
 
-                stats = utils_render.update_stats(engine.session)
+                stats = _update_stats(engine, scheduler)
                 if draw_film:
                     time_until_film_refresh = 0
                 utils_render.update_status_msg(stats, engine, depsgraph.scene, config, time_until_film_refresh)
@@ -143,11 +191,14 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
                 if _stop_requested(engine) or engine.session.HasDone():
                     break
 
-                last_stat_refresh = now
                 if draw_film:
-                    # Show updated film (this operation is expensive)
-                    engine.framebuffer.draw(engine, engine.session, depsgraph.scene, render_stopped=False)
-                    last_film_refresh = now
+                    # Request updated film, it is converted by the readback worker and shown
+                    # when it's done. If the worker is still busy, the refresh is tried again
+                    # in the next iteration.
+                    if engine.framebuffer.request_draw(engine, engine.session, depsgraph.scene,
+                                                       force_aov_refresh=bool(changes)):
+                        scheduler.film_done(now)
+                    _collect_costs(engine, scheduler)
 
             utils_render.update_status_msg(stats, engine, depsgraph.scene, config, time_until_film_refresh)
 
@@ -155,7 +206,8 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
             # Only do this if clamping is disabled, otherwise the value is meaningless.
             samples = stats.Get("stats.renderengine.pass").GetInt()
             if not checked_optimal_clamp and samples > clamp_warmup_samples:
-                clamp_value = utils_render.find_suggested_clamp_value(engine.session, depsgraph.scene)
+                with engine.framebuffer.film_lock:
+                    clamp_value = utils_render.find_suggested_clamp_value(engine.session, depsgraph.scene)
                 print("Recommended clamp value:", clamp_value)
                 checked_optimal_clamp = True
 
@@ -166,7 +218,7 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
         # Don't use up too much CPU time for this refresh loop, but stay responsive
         # Note: The engine Python code seems to be threaded by Blender,
         # so the interface would not even hang if we slept for minutes here
-        sleep(1 / 5)
+        sleep(scheduler.sleep_time(time()))
 
         # Check after we slept, before the next possible expensive operation
         if _stop_requested(engine):
@@ -174,9 +226,15 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
 
     # User wants to stop or halt condition is reached
     # Update stats to refresh film and draw the final result
-    stats = utils_render.update_stats(engine.session)
+    with engine.framebuffer.film_lock:
+        stats = utils_render.update_stats(engine.session)
     utils_render.update_status_msg(stats, engine, depsgraph.scene, config, time_until_film_refresh=0)
     engine.framebuffer.draw(engine, engine.session, depsgraph.scene, render_stopped=True)
+    if engine.checkpoint_writer:
+        # Save the final state, so the render can be continued later with more samples
+        engine.update_stats("Render", "Saving checkpoint...")
+        engine.checkpoint_writer.stop()
+        engine.checkpoint_writer = None
     engine.update_stats("Render", "Stopping session...")
     if engine.session.IsInPause():
         engine.session.Resume()
@@ -184,23 +242,26 @@ def _render_layer(engine, depsgraph, statistics, view_layer):
     # Clean up
     del engine.session
     engine.session = None
+    return engine.exporter
 
 
 def _stop_requested(engine):
     return engine.test_break() or LuxCoreDisplaySettings.stop_requested
 
 
-def _stat_refresh_interval(start, scene):
-    width, height = utils_render.calc_filmsize(scene)
-    is_big_image = width * height > 2000 * 2000
-    minimum = 4 if is_big_image else 1
-    maximum = 16
+def _update_stats(engine, scheduler):
+    start = time()
+    with engine.framebuffer.film_lock:
+        stats = utils_render.update_stats(engine.session)
+    now = time()
+    scheduler.add_cost("stats", now - start)
+    scheduler.stats_done(now, stats)
+    return stats
 
-    minutes = (time() - start) / 60
-    if minutes < 4:
-        return max(2**minutes, minimum)
-    else:
-        return maximum
+
+def _collect_costs(engine, scheduler):
+    for task, seconds, is_complete_run in engine.framebuffer.pop_costs():
+        scheduler.add_cost(task, seconds, estimate=is_complete_run)
 
 
 def _check_halt_conditions(engine, scene):
@@ -1,6 +1,12 @@
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
 from enum import Enum
+from hashlib import md5
 from time import sleep
 from os.path import dirname, realpath
+import bpy
 from mathutils import Matrix
 from ..bin import pyluxcore
 from .. import utils
@@ -16,11 +22,69 @@ blender/release/datafiles/preview.blend
 # Diameter of the default sphere, in meters
 DEFAULT_SPHERE_SIZE = 0.1
 
+LUXBALL_MESH_NAME = "Preview_LuxBall_Mesh"
+# How many finished previews are kept in memory
+RESULT_CACHE_SIZE = 16
+
 class PreviewType(Enum):
     NONE = 0
     MATERIAL = 1
 
 
+class PreviewSceneTemplate:
+    """
+    The part of the preview scene that is the same for every material: LuxBall mesh,
+    lights, backplates and ground. It is exported once and kept between previews,
+    only the camera and the objects of the previewed material are replaced.
+    """
+    # Only one preview at a time can use the templates
+    lock = threading.Lock()
+    # {is_world_sphere: PreviewSceneTemplate}
+    templates = {}
+
+    def __init__(self, is_world_sphere):
+        self.luxcore_scene = pyluxcore.Scene()
+        props = pyluxcore.Properties()
+
+        prefix = "scene.shapes." + LUXBALL_MESH_NAME + "."
+        filepath = dirname(dirname(realpath(__file__))) + "/preview_scene/LuxCore_preview.ply"
+        props.Set(pyluxcore.Property(prefix + "type", "mesh"))
+        props.Set(pyluxcore.Property(prefix + "ply", filepath))
+
+        # Lights (either two area lights or a sun+sky setup)
+        _create_lights(self.luxcore_scene, props, is_world_sphere)
+
+        if not is_world_sphere:
+            _create_backplates(self.luxcore_scene, props)
+        _create_ground(self.luxcore_scene, props)
+
+        self.luxcore_scene.Parse(props)
+        # Names of the objects that were added for the last previewed material
+        self.preview_objects = []
+
+    @classmethod
+    def get(cls, is_world_sphere):
+        try:
+            return cls.templates[is_world_sphere]
+        except KeyError:
+            template = cls(is_world_sphere)
+            cls.templates[is_world_sphere] = template
+            return template
+
+    def clear_preview_objects(self):
+        for name in self.preview_objects:
+            self.luxcore_scene.DeleteObject(name)
+        if self.preview_objects:
+            self.luxcore_scene.RemoveUnusedMaterials()
+            self.luxcore_scene.RemoveUnusedTextures()
+            self.luxcore_scene.RemoveUnusedImageMaps()
+        self.preview_objects = []
+
+
+# Finished previews, {fingerprint: pixels}, the most recently used last
+_result_cache = OrderedDict()
+
+
 # We use this as pyluxcore log handler to avoid spamming the console
 def no_log_output(message):
     pass
@@ -39,13 +103,64 @@ def render(engine, depsgraph):
     engine.exporter.scene = scene
     preview_type, active_mat = _get_preview_settings(depsgraph)
 
-    if preview_type == PreviewType.MATERIAL and not active_mat is None:
-        engine.session = _export_mat_scene(engine, depsgraph, active_mat)
-    else:
+    if preview_type != PreviewType.MATERIAL or active_mat is None:
         print("Unsupported preview type")
         return enable_log_output()
 
+    # The world sphere uses different lights and render settings
+    is_world_sphere = active_mat.use_preview_world
+
+    if PreviewSceneTemplate.lock.acquire(blocking=False):
+        try:
+            template = PreviewSceneTemplate.get(is_world_sphere)
+            template.clear_preview_objects()
+            _render_material(engine, depsgraph, active_mat, template)
+        finally:
+            # The template scene must not be used by a session anymore when the next preview edits it
+            engine.session = None
+            PreviewSceneTemplate.lock.release()
+    else:
+        # Another preview is still using the templates, use a temporary scene
+        _render_material(engine, depsgraph, active_mat, PreviewSceneTemplate(is_world_sphere))
+
+    # Do not hold reference to temporary data
+    engine.exporter.scene = None
+    enable_log_output()
 
+
+def _render_material(engine, depsgraph, active_mat, template):
+    scene = depsgraph.scene_eval
+    width, height = utils.calc_filmsize(scene)
+
+    scene_props, cam_props = _export_mat_scene(engine, depsgraph, active_mat, template)
+    config_props = _create_config(scene)
+
+    # Everything that is not part of the template goes into the fingerprint
+    fingerprint_data = str(cam_props) + str(scene_props) + str(config_props) + _get_file_state(scene_props)
+    fingerprint = md5(fingerprint_data.encode()).hexdigest()
+    fingerprint += str(active_mat.use_preview_world)
+
+    pixels = _result_cache.get(fingerprint)
+    if pixels is not None:
+        _result_cache.move_to_end(fingerprint)
+        result = engine.begin_result(0, 0, width, height)
+        combined = result.layers[0].passes["Combined"]
+        if bpy.app.version >= (2, 83, 0):
+            combined.rect.foreach_set(pixels)
+        else:
+            # foreach_set() is not available for the pass rect in older versions
+            combined.rect = pixels.reshape(-1, 4).tolist()
+        engine.end_result(result)
+        return
+
+    template.luxcore_scene.Parse(cam_props)
+    template.luxcore_scene.Parse(scene_props)
+    template.preview_objects = [key[len("scene.objects."):]
+                                for key in scene_props.GetAllUniqueSubNames("scene.objects")]
+
+    # Session
+    renderconfig = pyluxcore.RenderConfig(config_props, template.luxcore_scene)
+    engine.session = pyluxcore.RenderSession(renderconfig)
     engine.framebuffer = FrameBufferFinal(scene)
     engine.session.Start()
 
@@ -66,15 +181,25 @@ def render(engine, depsgraph):
 
         if engine.test_break():
             # Abort as fast as possible, without drawing the framebuffer again
+            engine.framebuffer.close(engine)
             engine.session.Stop()
-            return enable_log_output()
+            return
 
     engine.framebuffer.draw(engine, engine.session, scene, True)
+    _cache_result(fingerprint, engine.session, width, height)
     engine.session.Stop()
 
-    # Do not hold reference to temporary data
-    engine.exporter.scene = None
-    enable_log_output()
+
+def _cache_result(fingerprint, session, width, height):
+    rgb = np.empty(width * height * 3, dtype=np.float32)
+    session.GetFilm().GetOutputFloat(pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE, rgb)
+    # The preview film is not transparent
+    pixels = np.ones((width * height, 4), dtype=np.float32)
+    pixels[:, :3] = rgb.reshape(-1, 3)
+
+    _result_cache[fingerprint] = pixels.ravel()
+    while len(_result_cache) > RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
 
 
 def enable_log_output():
@@ -82,18 +207,38 @@ def enable_log_output():
     pyluxcore.SetLogHandler(LuxCoreLog.add)
 
 
-def _export_mat_scene(engine, depsgraph, active_mat):
+def _get_file_state(scene_props):
+    """
+    Image maps and other files are only referenced by path in the props. Their modification
+    time and size are added to the fingerprint, so the preview is rendered again after an
+    image was repainted, reloaded or replaced.
+    """
+    state = ""
+    for name in scene_props.GetAllNames():
+        if not name.endswith("file"):
+            continue
+        path = scene_props.Get(name).GetString()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        state += "%s:%d:%d;" % (path, stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def _export_mat_scene(engine, depsgraph, active_mat, template):
+    """
+    Export the camera and the objects of the previewed material.
+    Meshes are defined in the template scene directly, the returned props are not parsed yet.
+    """
     from ..export.caches.exported_data import ExportedObject
     from ..export.caches.object_cache import export_material, define_shapes
 
     exporter = engine.exporter
     scene = depsgraph.scene_eval
+    luxcore_scene = template.luxcore_scene
 
     scene_props = pyluxcore.Properties()
-    luxcore_scene = pyluxcore.Scene()
-
-    # The world sphere uses different lights and render settings
-    is_world_sphere = active_mat.use_preview_world
 
     # Camera
     cam_props = export.camera.convert(exporter, scene, depsgraph)
@@ -103,7 +248,6 @@ def _export_mat_scene(engine, depsgraph, active_mat):
     cam_props.Set(pyluxcore.Property("scene.camera.autovolume.enable", 0))
     zoom = active_mat.luxcore.preview.zoom
     cam_props.Set(pyluxcore.Property("scene.camera.fieldofview", field_of_view / zoom))
-    luxcore_scene.Parse(cam_props)
 
     # Objects
     for dg_obj_instance in depsgraph.object_instances:
@@ -117,20 +261,10 @@ def _export_mat_scene(engine, depsgraph, active_mat):
             continue
 
         if obj.name == "preview_shaderball":
-            # Use LuxBall instead of Blender Shaderball
+            # Use LuxBall instead of Blender Shaderball (the mesh is part of the template)
             is_viewport_render = False
             obj_key = "Preview_LuxBall_Object"
-            mesh_key = "Preview_LuxBall_Mesh"
-
-            mesh_definitions = []
-            props = pyluxcore.Properties()
-            filepath = dirname(dirname(realpath(__file__))) + "/preview_scene/LuxCore_preview.ply"
-
-            prefix = "scene.shapes." + mesh_key + "."
-            props.Set(pyluxcore.Property(prefix + "type", "mesh"))
-            props.Set(pyluxcore.Property(prefix + "ply", filepath))
-            mesh_definitions.append((mesh_key, 0))
-            scene_props.Set(props)
+            mesh_definitions = [(LUXBALL_MESH_NAME, 0)]
 
             mat_names = []
             for idx, (shape_name, mat_index) in enumerate(mesh_definitions):
@@ -160,23 +294,9 @@ def _export_mat_scene(engine, depsgraph, active_mat):
             shape_props.Set(pyluxcore.Property(shape_key + ".maxlevel", min(max_level, 1)))
             scene_props.Set(shape_props)
 
-    # Lights (either two area lights or a sun+sky setup)
-    _create_lights(scene, luxcore_scene, scene_props, is_world_sphere)
-
-    if not is_world_sphere:
-        _create_backplates(luxcore_scene, scene_props)
-    _create_ground(luxcore_scene, scene_props)
-
-    luxcore_scene.Parse(scene_props)
-
-    # Session
-    config_props = _create_config(scene)
-    renderconfig = pyluxcore.RenderConfig(config_props, luxcore_scene)
-    session = pyluxcore.RenderSession(renderconfig)
-    
-    return session
+    return scene_props, cam_props
 
-def _create_lights(scene, luxcore_scene, props, is_world_sphere):
+def _create_lights(luxcore_scene, props, is_world_sphere):
     if is_world_sphere:
         props.Set(pyluxcore.Property("scene.lights.sky.type", "sky2"))
         props.Set(pyluxcore.Property("scene.lights.sky.gain", [.00003] * 3))
@@ -196,7 +316,7 @@ def _create_lights(scene, luxcore_scene, props, is_world_sphere):
                 (-0.22214478254318237, 0.7306543588638306, -0.6455973386764526),
                 (-0.8227329850196838, 0.21485532820224762, 0.526258111000061)))
         scale_key = 1
-        _create_area_light(scene, luxcore_scene, props, "key", color_key,
+        _create_area_light(luxcore_scene, props, "key", color_key,
                            position_key, rotation_key, scale_key)
 
         # Fill light
@@ -206,11 +326,11 @@ def _create_lights(scene, luxcore_scene, props, is_world_sphere):
                 (0.13679763674736023, 0.9016143679618835, -0.4103388786315918, ),
                 (0.9712990522384644, -0.04071354120969772, 0.23435142636299133 )))
         scale_fill = 2
-        _create_area_light(scene, luxcore_scene, props, "fill", color_fill,
+        _create_area_light(luxcore_scene, props, "fill", color_fill,
                            position_fill, rotation_fill, scale_fill, False)
 
 
-def _create_area_light(scene, luxcore_scene, props, name, color, position, rotation_matrix, scale, visible=True):
+def _create_area_light(luxcore_scene, props, name, color, position, rotation_matrix, scale, visible=True):
     mat_name = name + "_mat"
     mesh_name = name + "_mesh"
 
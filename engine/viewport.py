@@ -7,6 +7,9 @@ from ..utils import render as utils_render
 from ..utils.errorlog import LuxCoreErrorLog
 from ..export.config import convert_viewport_engine
 
+# Time per redraw that is spent on adding objects to the session in staged export (seconds)
+STAGED_EXPORT_TIME_BUDGET = 0.05
+
 # Executed in separate thread
 def start_session(engine):
     try:
@@ -44,6 +47,48 @@ def force_session_restart(engine):
     engine.session = None
 
 
+def apply_config_change(engine, context, depsgraph, changes):
+    """
+    Apply config changes (e.g. viewport resize). The session is stopped like in
+    force_session_restart(), but the exporter and its scene are kept, so view_update()
+    only has to create a new session for the scene (after the resize timeout).
+    """
+    force_session_restart(engine)
+
+    if not depsgraph.scene_eval.luxcore.viewport.reuse_scene_on_config_change:
+        # Invalidate all caches so the scene is exported again
+        engine.exporter = None
+
+
+def export_pending_objects(engine, context, depsgraph):
+    """
+    Staged export: add the next objects to the running session. Called once per redraw,
+    so the export can be interrupted at any time by the user (edits, viewport stop).
+    """
+    start = time()
+    try:
+        exported_count = engine.exporter.export_pending_objects(depsgraph, context, engine.session,
+                                                                STAGED_EXPORT_TIME_BUDGET)
+    except Exception as error:
+        print("[Engine/Viewport] Error during staged export, exporting the whole scene:", error)
+        import traceback
+        traceback.print_exc()
+        LuxCoreErrorLog.add_error(error)
+        engine.update_stats("Error: ", "Staged export failed, exporting the whole scene")
+        # The session might contain a partially exported object. Restart it with a full export,
+        # which exports all objects that were still pending.
+        force_session_restart(engine)
+        engine.exporter = None
+        engine.staged_export_failed = True
+        return
+
+    engine.viewport_start_time = time()
+    if engine.framebuffer:
+        engine.framebuffer.reset_denoiser()
+    print("[Engine/Viewport] Staged export: added %d objects in %.1f ms, %d left"
+          % (exported_count, (time() - start) * 1000, len(engine.exporter.object_cache2.pending_objects)))
+
+
 def view_update(engine, context, depsgraph, changes=None):
     start = time()
     if engine.starting_session or engine.viewport_fatal_error:
@@ -57,6 +102,18 @@ def view_update(engine, context, depsgraph, changes=None):
             # Let one engine.view_draw() happen so it shows a message in the UI
             return
 
+        exporter = engine.exporter
+        if exporter and exporter.luxcore_scene is not None:
+            # A config change is pending (see apply_config_change()). If the scene is
+            # edited in the meantime, it has to be exported again. get_changes() consumes
+            # the changes, so this is the only place where they are checked, also during
+            # the resize timeout. It also brings the caches used by
+            # create_session_for_config_change() up to date.
+            scene_changes = exporter.get_changes(depsgraph, context)
+            if scene_changes & export.Change.REQUIRES_SCENE_EDIT & ~export.Change.CAMERA:
+                print("[Engine/Viewport] Scene was edited during the config change, exporting again")
+                exporter.luxcore_scene = None
+
         if not engine.is_first_viewport_start:
             filmsize = utils.calc_filmsize(depsgraph.scene_eval, context)
             was_resized = engine.last_viewport_size != filmsize
@@ -72,8 +129,20 @@ def view_update(engine, context, depsgraph, changes=None):
         try:
             print("=" * 50)
             print("[Engine/Viewport] New session")
-            engine.exporter = export.Exporter()
-            engine.session = engine.exporter.create_session(depsgraph, context, engine=engine)
+            if exporter and exporter.luxcore_scene is not None:
+                try:
+                    engine.session = exporter.create_session_for_config_change()
+                except Exception as error:
+                    print("[Engine/Viewport] Could not re-use the exported scene:", error)
+                    import traceback
+                    traceback.print_exc()
+                if engine.framebuffer:
+                    engine.framebuffer.reset_denoiser()
+
+            if engine.session is None:
+                engine.exporter = export.Exporter()
+                staged = depsgraph.scene_eval.luxcore.viewport.use_staged_export and not engine.staged_export_failed
+                engine.session = engine.exporter.create_session(depsgraph, context, engine=engine, staged=staged)
             # Start in separate thread to avoid blocking the UI
             engine.starting_session = True
             engine.is_first_viewport_start = False
@@ -99,7 +168,7 @@ def view_update(engine, context, depsgraph, changes=None):
 
     if changes:
         if changes & export.Change.REQUIRES_VIEW_UPDATE:
-            force_session_restart(engine)
+            apply_config_change(engine, context, depsgraph, changes)
             return
 
         s = time()
@@ -171,8 +240,7 @@ def view_draw(engine, context, depsgraph):
 
     if changes & export.Change.REQUIRES_VIEW_UPDATE:
         engine.tag_redraw()
-        # view_update(engine, context, depsgraph, changes)  # Disabled, see comment on force_session_restart()
-        force_session_restart(engine)
+        apply_config_change(engine, context, depsgraph, changes)
         return
     elif changes & export.Change.CAMERA:
         # Only update in view_draw if it is a camera update,
@@ -182,6 +250,13 @@ def view_draw(engine, context, depsgraph):
         engine.session = engine.exporter.update(depsgraph, context, engine.session, export.Change.CAMERA)
         engine.viewport_start_time = time()
 
+    if engine.exporter.object_cache2.pending_objects:
+        export_pending_objects(engine, context, depsgraph)
+        engine.tag_redraw()
+        if engine.session is None:
+            # The staged export failed, the scene is exported again in view_update()
+            return
+
     if utils.in_material_shading_mode(context):
         if not engine.session.IsInPause():
             engine.session.WaitNewFrame()
@@ -245,4 +320,7 @@ def view_draw(engine, context, depsgraph):
     config = engine.session.GetRenderConfig()
     stats = engine.session.GetStats()
     pretty_stats = utils_render.get_pretty_stats(config, stats, scene, context)
+    pending_count = len(engine.exporter.object_cache2.pending_objects)
+    if pending_count:
+        status_message = "(Loading objects, %d left)" % pending_count
     engine.update_stats(pretty_stats, status_message)
@@ -10,6 +10,7 @@ from . import (
     imagepipeline, light, material,
     motion_blur, hair, halt, world,
 )
+from .ies import IESExporter
 from .light import WORLD_BACKGROUND_LIGHT_NAME
 from .caches.object_cache import supports_live_transform
 
@@ -71,12 +72,24 @@ class Exporter(object):
         # If a light/material uses a lightgroup, the id is stored here during export
         self.lightgroup_cache = set()
 
-    def create_session(self, depsgraph, context=None, engine=None, view_layer=None):
+        # Definitions of point and spot lights, shared by all lights using the same light datablock.
+        # Only used in final render, see light._convert_light_from_template()
+        # {light_key: definitions}
+        self.light_template_cache = {}
+
+        # The exported scene, kept so config changes in viewport render and following
+        # view layers in final render can create a new session without re-exporting
+        # (see create_session_for_config_change() and create_session_for_view_layer())
+        self.luxcore_scene = None
+
+    def create_session(self, depsgraph, context=None, engine=None, view_layer=None, staged=False):
         # Notes:
         # In final render, context is None
+        # If staged is True (viewport only), mesh objects are exported later by export_pending_objects()
 
         print("[Exporter] Creating session")
         start = time()
+        IESExporter.begin_export()
         # TODO 2.8 I'm not too happy about this, we shouldn't keep any reference to temporary data, even if only for a while
         self.scene = depsgraph.scene_eval
         scene = self.scene
@@ -106,8 +119,10 @@ class Exporter(object):
 
         # Objects and lights
         is_viewport_render = context is not None
+        staged = staged and is_viewport_render
+        proxy_type = scene.luxcore.viewport.proxy_geometry if staged else "NONE"
         instances = self.object_cache2.first_run(self, depsgraph, view_layer, engine, luxcore_scene,
-                                                 scene_props, context)
+                                                 scene_props, context, defer_meshes=staged, proxy_type=proxy_type)
         if instances is None:
             # Export was cancelled by user
             return None
@@ -132,6 +147,7 @@ class Exporter(object):
 
         # World
         world_props = world.convert(self, depsgraph, scene, is_viewport_render)
+        self.world_cache.init(world_props, scene)  # Init world cache
         scene_props.Set(world_props)
 
         if scene.luxcore.debug.enabled and scene.luxcore.debug.print_properties:
@@ -147,6 +163,15 @@ class Exporter(object):
         # The instances dict can be quite large, delete explicitely (TODO maybe even call gc.collect()?)
         del instances
 
+        if self.object_cache2.pending_objects and luxcore_scene.GetLightCount() == 0:
+            # LuxCore can't start a session without light sources, so if the only
+            # lights are emissive meshes, the staged export has to be done now
+            pending_props = pyluxcore.Properties()
+            self.object_cache2.export_pending(self, depsgraph, luxcore_scene, pending_props,
+                                              context, float("inf"))
+            luxcore_scene.Parse(pending_props)
+            self.object_cache2.remove_proxy_meshes(luxcore_scene)
+
         # Regularly check if we should abort the export (important in heavy scenes)
         if engine and engine.test_break():
             return None
@@ -246,10 +271,110 @@ class Exporter(object):
             message += " ..."
             engine.update_stats("Export Finished (%.1f s)" % export_time, message)
 
+        self.luxcore_scene = luxcore_scene
+
         # Do not hold reference to temporary data
         self.scene = None
         return pyluxcore.RenderSession(renderconfig)
 
+    def create_session_for_view_layer(self, depsgraph, engine, view_layer):
+        """
+        Create a final render session for another view layer from the scene that was exported
+        for the previous layer. Only the camera visibility of objects and the config (AOVs,
+        halt conditions) are converted again.
+        Returns None if the scene can't be re-used, in this case a full export is required.
+        """
+        if self.luxcore_scene is None:
+            return None
+
+        print("[Exporter] Re-using exported scene for view layer", view_layer.name)
+        start = time()
+        self.scene = depsgraph.scene_eval
+        scene = self.scene
+
+        scene_props = pyluxcore.Properties()
+        if not self.object_cache2.update_camera_visibility(view_layer, scene_props):
+            print("[Exporter] Camera visibility of instanced objects differs, exporting again")
+            self.scene = None
+            return None
+        self.luxcore_scene.Parse(scene_props)
+
+        config_props = config.convert(self, scene, None, engine)
+        if str(config_props) == "":
+            # Config props are empty: there was a critical error in config export, we can't render
+            raise Exception("Errors in config, check error log")
+        self.config_cache.diff(str(config_props))
+
+        imagepipeline_props = imagepipeline.convert(scene, None)
+        self.imagepipeline_cache.diff(imagepipeline_props)
+        config_props.Set(imagepipeline_props)
+
+        halt_props = halt.convert(scene)
+        self.halt_cache.diff(halt_props)
+        config_props.Set(halt_props)
+
+        if scene.luxcore.debug.enabled and scene.luxcore.debug.print_properties:
+            print("-" * 50)
+            print("DEBUG: Config Properties:\n")
+            print(config_props)
+            print("-" * 50)
+        session = create_session_for_scene(self.luxcore_scene, config_props)
+
+        export_time = time() - start
+        print("Export took %.1f s" % export_time)
+        if self.stats:
+            # The scene statistics of the previous layer are still valid
+            self.stats.export_time.value = export_time
+            self._init_stats(self.stats, config_props, scene)
+
+        engine.update_stats("Export Finished (%.1f s)" % export_time, "Creating RenderSession ...")
+
+        # Do not hold reference to temporary data
+        self.scene = None
+        return session
+
+    def init_resumed_config(self, depsgraph, engine, renderconfig):
+        """
+        Final render resumed from a checkpoint: the scene and config are loaded from the resume file.
+        Restore the state that is normally collected during the export (light groups, AOV imagepipelines)
+        without exporting the scene again, and apply the current imagepipeline and halt conditions.
+        """
+        self.scene = depsgraph.scene_eval
+        scene = self.scene
+        resumed_props = renderconfig.GetProperties()
+
+        # The light groups are normally collected during the light and material export,
+        # each one has an imagepipeline with e.g. "film.imagepipelines.001.radiancescales.2.enabled"
+        for name in resumed_props.GetAllNames("film.imagepipelines."):
+            parts = name.split(".")
+            if len(parts) == 6 and parts[3] == "radiancescales":
+                self.lightgroup_cache.add(int(parts[4]))
+
+        # Fills engine.aov_imagepipelines
+        config_props = config.convert(self, scene, None, engine)
+        if str(config_props) == "":
+            # Config props are empty: there was a critical error in config export, we can't render
+            raise Exception("Errors in config, check error log")
+        self.config_cache.diff(str(config_props))
+
+        if _get_film_outputs(config_props) != _get_film_outputs(resumed_props):
+            LuxCoreErrorLog.add_warning("AOVs or light groups were changed since the checkpoint was saved, "
+                                        "some passes might be missing or wrong")
+
+        imagepipeline_props = imagepipeline.convert(scene, None)
+        self.imagepipeline_cache.diff(imagepipeline_props)
+        renderconfig.Parse(imagepipeline_props)
+
+        halt_props = halt.convert(scene)
+        self.halt_cache.diff(halt_props)
+        renderconfig.Parse(halt_props)
+
+        if self.stats:
+            self._init_stats(self.stats, resumed_props, scene)
+
+        # Do not hold reference to temporary data
+        self.scene = None
+
     def get_viewport_changes(self, depsgraph, context=None):
         self.scene = depsgraph.scene_eval
         changes = Change.NONE
@@ -288,7 +413,7 @@ class Exporter(object):
                 if self.visibility_cache.has_new_objects:
                     changes |= Change.OBJECT
 
-            if self.world_cache.diff(depsgraph):
+            if self.world_cache.diff(self, depsgraph):
                 changes |= Change.WORLD
 
         if changes is None:
@@ -314,6 +439,7 @@ class Exporter(object):
         print("[Exporter] Update because of:", Change.to_string(changes))
         # Invalidate node cache
         self.node_cache.clear()
+        IESExporter.begin_export()
 
         if changes & Change.CONFIG:
             # We already converted the new config settings during get_changes(), re-use them
@@ -354,23 +480,69 @@ class Exporter(object):
         # because it might have been replaced in _update_config()
         return session
 
+    def export_pending_objects(self, depsgraph, context, session, time_budget):
+        """
+        Staged viewport export: add the objects that were deferred in create_session()
+        to the running session, as many as possible within time_budget (seconds).
+        Returns the number of exported objects.
+        """
+        self.scene = depsgraph.scene_eval
+        # Invalidate node cache
+        self.node_cache.clear()
+
+        luxcore_scene = session.GetRenderConfig().GetScene()
+        props = pyluxcore.Properties()
+        session.BeginSceneEdit()
+
+        try:
+            exported_count = self.object_cache2.export_pending(self, depsgraph, luxcore_scene, props,
+                                                               context, time() + time_budget)
+            luxcore_scene.Parse(props)
+            if not self.object_cache2.pending_objects:
+                # The meshes of the last objects are used now, so only the stand-in meshes are removed
+                self.object_cache2.remove_proxy_meshes(luxcore_scene)
+        finally:
+            session.EndSceneEdit()
+            # Do not hold reference to temporary data
+            self.scene = None
+
+        if session.IsInPause():
+            session.Resume()
+        return exported_count
+
     def update_session(self, changes, session):
         if changes & Change.IMAGEPIPELINE:
             session.Parse(self.imagepipeline_cache.props)
         if changes & Change.HALT:
             session.Parse(self.halt_cache.props)
 
+    def create_session_for_config_change(self):
+        """
+        Viewport: create a new session that renders the already exported scene with the current
+        config, after the old session was stopped because of a config change (e.g. viewport resize).
+        Re-parsing the config of the running session caused a memory leak
+        (https://github.com/LuxCoreRender/BlendLuxCore/issues/577), so a new
+        RenderConfig is created instead. See scripts/dev/viewport_config_leak_check.py
+        The caches have to be up to date, i.e. get_changes() was called since the old session
+        was stopped, and luxcore_scene was released if the scene was edited (see view_update()).
+        The session is not started. Returns None if there is no exported scene.
+        """
+        if self.luxcore_scene is None:
+            return None
+
+        # No session is running on the scene, so the camera can be updated without scene edit
+        self.luxcore_scene.Parse(self.camera_cache.props)
+
+        props = pyluxcore.Properties(self.config_cache.props)
+        props.Set(self.imagepipeline_cache.props)
+        props.Set(self.halt_cache.props)
+        return create_session_for_scene(self.luxcore_scene, props)
+
     def _update_config(self, session, config_props):
-        # Note: Currently not used, see the comment on force_session_restart() in engine/viewport.py
+        # Note: Not used in viewport render, config changes stop the session and
+        # create a new one, see create_session_for_config_change()
         raise NotImplementedError("_update_config() currently not supported due to memory leak "
                                   "(see https://github.com/LuxCoreRender/BlendLuxCore/issues/577)")
-        # renderconfig = session.GetRenderConfig()
-        # session.Stop()
-        #
-        # renderconfig.Parse(config_props)
-        # session = pyluxcore.RenderSession(renderconfig)
-        # session.Start()
-        # return session
 
     def _update_scene(self, depsgraph, context, changes, luxcore_scene):
         props = pyluxcore.Properties()
@@ -392,6 +564,9 @@ class Exporter(object):
             for key in self.visibility_cache.objects_to_remove:
                 print("Removing object with key", key)
 
+                # Objects that are not exported yet in staged export
+                self.object_cache2.pending_objects.pop(key, None)
+
                 try:
                     exported_obj = self.object_cache2.exported_objects.pop(key)
                     exported_obj.delete(luxcore_scene)
@@ -409,8 +584,8 @@ class Exporter(object):
             if not context.scene.world or context.scene.world.luxcore.light == "none":
                 luxcore_scene.DeleteLight(WORLD_BACKGROUND_LIGHT_NAME)
 
-            world_props = world.convert(self, depsgraph, context.scene, is_viewport_render=True)
-            props.Set(world_props)
+            # We already converted the new world settings during get_changes(), re-use them
+            props.Set(self.world_cache.props)
 
         return props
 
@@ -444,3 +619,14 @@ class Exporter(object):
         
         stats.use_hybridbackforward.value = (config_props.Get("path.hybridbackforward.enable", [False]).GetBool()
                                              and render_engine != "BIDIRCPU")
+
+
+def _get_film_outputs(props):
+    return sorted(props.Get(name).GetString() for name in props.GetAllNames("film.outputs.")
+                  if name.endswith(".type"))
+
+
+def create_session_for_scene(luxcore_scene, config_props):
+    """ Create a new RenderConfig and RenderSession for an already exported scene """
+    renderconfig = pyluxcore.RenderConfig(config_props, luxcore_scene)
+    return pyluxcore.RenderSession(renderconfig)
@@ -1,7 +1,7 @@
 import bpy
 from ... import utils
 from ...utils import EXPORTABLE_OBJECTS
-from .. import camera, material
+from .. import camera, material, world
 
 from .object_cache import ObjectCache2, supports_live_transform
 
@@ -100,26 +100,46 @@ class VisibilityCache:
 
 
 class WorldCache:
+    """
+    Blender reports world updates (id_type_updated("WORLD")) whenever any node tree is edited,
+    even if the world is not touched at all. Because a world update can re-parse a huge HDRI and
+    restarts convergence, the converted world props are compared with the previous ones and
+    an update is only issued if they changed (the sun direction, if used, is part of the props).
+    """
     def __init__(self):
         self.world_name = None
+        self.string_cache = StringCache()
 
-    def diff(self, depsgraph):
-        world = depsgraph.scene_eval.world
-        world_updated = False
+    @property
+    def props(self):
+        return self.string_cache.props
 
-        if world:
-            # TODO 2.8 for some reason this fires when editing a node tree, even when the world is not touched at all
-            world_updated = depsgraph.id_type_updated("WORLD") or self.world_name != world.name_full
+    def init(self, world_props, scene):
+        self.string_cache.diff(world_props)
+        self.world_name = scene.world.name_full if scene.world else None
+
+    def diff(self, exporter, depsgraph):
+        scene = depsgraph.scene_eval
+        blender_world = scene.world
+        maybe_updated = False
+
+        if blender_world:
+            maybe_updated = depsgraph.id_type_updated("WORLD") or self.world_name != blender_world.name_full
 
             # The sun influcences the world, e.g. through direction and turbidity if sky2 is used
-            if world.luxcore.light == "sky2" and depsgraph.id_type_updated("OBJECT"):
+            if blender_world.luxcore.light == "sky2" and depsgraph.id_type_updated("OBJECT"):
                 for dg_update in depsgraph.updates:
-                    if dg_update.id == world.luxcore.sun:
-                        world_updated = True
+                    if dg_update.id == blender_world.luxcore.sun:
+                        maybe_updated = True
                         break
         elif self.world_name:
             # We had a world, but it was deleted
-            world_updated = True
+            maybe_updated = True
+
+        self.world_name = blender_world.name_full if blender_world else None
+
+        if not maybe_updated:
+            return False
 
-        self.world_name = world.name_full if world else None
-        return world_updated
+        world_props = world.convert(exporter, depsgraph, scene, is_viewport_render=True)
+        return self.string_cache.diff(world_props)
@@ -2,6 +2,8 @@ import bpy
 from array import array
 from functools import lru_cache
 from time import time
+from mathutils import Vector
+from bpy_extras.view3d_utils import location_3d_to_region_2d
 
 from ... import utils
 from ...bin import pyluxcore
@@ -24,6 +26,15 @@ class TriAOVDataIndices:
 
 MAX_PARTICLES_FOR_LIVE_TRANSFORM = 2000
 
+# Material of the stand-in objects of the staged viewport export
+PROXY_MATERIAL_NAME = "__proxy_material__"
+# Fraction of the triangles of the base mesh that simplified proxies keep
+PROXY_SIMPLIFY_TARGET = 0.05
+PROXY_SIMPLIFIED_SUFFIX = "_simplified"
+# Time spent on simplified proxies before the first frame (seconds),
+# the remaining pending objects get bounding box proxies
+PROXY_SIMPLIFIED_TIME_BUDGET = 0.5
+
 
 def uses_pointiness(node_tree):
     # TODO better check would be if the node is linked to the output and actually used
@@ -202,6 +213,60 @@ def _update_stats(engine, current_obj_name, extra_obj_info, current_index, total
     engine.update_progress(current_index / total_object_count)
 
 
+def estimate_screen_coverage(obj, matrix_world, context):
+    """ Returns the fraction of the viewport covered by the bounding box of the object """
+    region = context.region
+    points = [location_3d_to_region_2d(region, context.region_data, matrix_world @ Vector(corner))
+              for corner in obj.bound_box]
+    # Points behind the viewport camera are None
+    points = [point for point in points if point is not None]
+    if not points or region.width == 0 or region.height == 0:
+        return 0
+
+    width = min(max(p.x for p in points), region.width) - max(min(p.x for p in points), 0)
+    height = min(max(p.y for p in points), region.height) - max(min(p.y for p in points), 0)
+    return max(width, 0) * max(height, 0) / (region.width * region.height)
+
+
+def define_bounding_box_mesh(obj, mesh_name, luxcore_scene):
+    """ Define a box mesh with the bounding box of the object (in object space) """
+    vertices = [tuple(corner) for corner in obj.bound_box]
+    # Quads of the box, see the corner order of Object.bound_box
+    quads = [
+        (0, 1, 2, 3),
+        (4, 7, 6, 5),
+        (0, 4, 5, 1),
+        (3, 2, 6, 7),
+        (0, 3, 7, 4),
+        (1, 5, 6, 2),
+    ]
+    faces = []
+    for a, b, c, d in quads:
+        faces.append((a, b, c))
+        faces.append((c, d, a))
+
+    luxcore_scene.DefineMesh(mesh_name, vertices, faces, None, None, None, None)
+    return [[mesh_name, 0]]
+
+
+def define_simplified_mesh(obj, mesh_name, depsgraph, luxcore_scene, scene_props):
+    """ Define the base mesh of the object (without modifiers), reduced with a simplify shape """
+    exported_mesh = mesh_converter.convert(obj, mesh_name, depsgraph, luxcore_scene, True, True, None,
+                                           use_modifiers=False)
+    if not exported_mesh:
+        return None
+
+    mesh_definitions = []
+    for shape, mat_index in exported_mesh.mesh_definitions:
+        simplified_shape = shape + PROXY_SIMPLIFIED_SUFFIX
+        prefix = "scene.shapes." + simplified_shape + "."
+        scene_props.Set(pyluxcore.Property(prefix + "type", "simplify"))
+        scene_props.Set(pyluxcore.Property(prefix + "source", shape))
+        scene_props.Set(pyluxcore.Property(prefix + "target", PROXY_SIMPLIFY_TARGET))
+        mesh_definitions.append([simplified_shape, mat_index])
+    return mesh_definitions
+
+
 def get_obj_count_estimate(depsgraph):
     # This is faster than len(depsgraph.object_instances)
     # TODO: count dupliverts and dupliframes
@@ -216,8 +281,10 @@ def get_obj_count_estimate(depsgraph):
 
 
 class Duplis:
-    def __init__(self, exported_obj):
+    def __init__(self, exported_obj, area_light=None):
         self.exported_obj = exported_obj
+        # If set, the duplicated object is an area light and the light size has to be applied to the matrices
+        self.area_light = area_light
         self.matrices = array("f", [])
         self.object_ids = array("I", [])
 
@@ -225,15 +292,63 @@ class Duplis:
         return len(self.object_ids)
 
 
+class PendingObject:
+    """
+    Handle of a singular mesh object that is exported later in staged viewport export, see
+    export_pending(). The object is looked up by name, so the depsgraph object instances don't
+    have to be searched again. Replaces the depsgraph object instance in _convert_obj().
+    """
+    is_instance = False
+    parent = None
+
+    def __init__(self, dg_obj_instance, coverage):
+        original = dg_obj_instance.object.original
+        self.lookup_key = (original.name, original.library.filepath if original.library else None)
+        self.coverage = coverage
+        self.show_self = dg_obj_instance.show_self
+        self.show_particles = dg_obj_instance.show_particles
+        self.object = None
+        self.matrix_world = None
+
+    def resolve(self, depsgraph):
+        """ Get the current evaluated object, returns False if it was deleted """
+        original = bpy.data.objects.get(self.lookup_key)
+        if original is None:
+            return False
+        self.object = original.evaluated_get(depsgraph)
+        self.matrix_world = self.object.matrix_world
+        return True
+
+
 class ObjectCache2:
     def __init__(self):
         self.exported_objects = {}
         self.exported_meshes = {}
         self.exported_hair = {}
-
-    def first_run(self, exporter, depsgraph, view_layer, engine, luxcore_scene, scene_props, context):
+        # Objects whose camera visibility depends on the view layer (final render only).
+        # {obj_key: (visibility_source, editable)}, see update_camera_visibility()
+        self.camera_visibility_sources = {}
+        # Mesh objects that are not exported yet in staged viewport export, sorted by
+        # screen coverage (largest first). {obj_key: PendingObject}, see export_pending()
+        self.pending_objects = {}
+        # Stand-in meshes of pending objects, {proxy_key: mesh_definitions}
+        self.exported_proxies = {}
+
+    def first_run(self, exporter, depsgraph, view_layer, engine, luxcore_scene, scene_props, context,
+                  defer_meshes=False, proxy_type="NONE"):
+        """
+        If defer_meshes is True (only in viewport render), singular mesh objects are not
+        exported, but added to self.pending_objects for export_pending().
+        proxy_type ("NONE", "BOUNDING_BOX" or "SIMPLIFIED") selects the stand-in that is
+        shown for pending objects until they are exported.
+        """
         is_viewport_render = bool(context)
         instances = {}
+        pending_objects = []
+
+        if defer_meshes and proxy_type != "NONE":
+            scene_props.Set(material.fallback(PROXY_MATERIAL_NAME)[1])
+        simplified_proxy_deadline = time() + PROXY_SIMPLIFIED_TIME_BUDGET
 
         if engine:
             obj_count_estimate = max(1, get_obj_count_estimate(depsgraph))
@@ -244,9 +359,23 @@ class ObjectCache2:
         for index, dg_obj_instance in enumerate(depsgraph.object_instances):
             obj = dg_obj_instance.object
 
+            if not is_viewport_render and obj.type == "LIGHT" and obj.data.type in light.TEMPLATE_LIGHT_TYPES:
+                # Fast path for scenes with thousands of point and spot lights (e.g. instanced street lamps).
+                # LuxCore can't duplicate lights like objects, but the light definitions are only converted
+                # once per light datablock (see light._convert_light_from_template)
+                if engine and index % 1000 == 0:
+                    if engine.test_break():
+                        return None
+                    _update_stats(engine, obj.name, " (light)", index, obj_count_estimate)
+
+                if utils.is_instance_visible(dg_obj_instance, obj, context):
+                    self._convert_obj(exporter, dg_obj_instance, obj, depsgraph, luxcore_scene,
+                                      scene_props, is_viewport_render, view_layer, engine)
+                continue
+
             if (dg_obj_instance.is_instance
                     and not (is_viewport_render and supports_live_transform(dg_obj_instance.particle_system))
-                    and obj.type in MESH_OBJECTS):
+                    and (obj.type in MESH_OBJECTS or light.is_area_meshlight(obj))):
                 # This code is optimized for large amounts of duplis. Drawback is that objects generated from this
                 # code can't be transformed later in a viewport render session (due to BlendLuxCore implementation
                 # reasons, not because of LuxCore)
@@ -267,7 +396,11 @@ class ObjectCache2:
                         duplis.object_ids.append(obj_id)
                         # We need a copy of matrix_world here, not sure why, but if we don't
                         # make a copy, we only get an identity matrix in C++
-                        duplis.matrices.extend(pyluxcore.BlenderMatrix4x4ToList(dg_obj_instance.matrix_world.copy()))
+                        matrix = dg_obj_instance.matrix_world.copy()
+                        if duplis.area_light:
+                            # All area lights are instances of a unit quad, the size is part of the transformation
+                            matrix = light.calc_area_light_transformation(duplis.area_light, matrix)
+                        duplis.matrices.extend(pyluxcore.BlenderMatrix4x4ToList(matrix))
                 except KeyError:
                     if engine:
                         if engine.test_break():
@@ -278,7 +411,8 @@ class ObjectCache2:
                     if exported_obj:
                         # Note, the transformation matrix and object ID of this first instance is not added
                         # to the duplication list, since it already exists in the scene
-                        instances[obj.original.as_pointer()] = Duplis(exported_obj)
+                        area_light = obj.data if obj.type == "LIGHT" else None
+                        instances[obj.original.as_pointer()] = Duplis(exported_obj, area_light)
                     else:
                         # Could not export the object, happens e.g. with curve objects with zero faces
                         instances[obj.original.as_pointer()] = None
@@ -287,6 +421,19 @@ class ObjectCache2:
                 if not utils.is_instance_visible(dg_obj_instance, obj, context):
                     continue
 
+                if defer_meshes and obj.type in MESH_OBJECTS and not dg_obj_instance.is_instance:
+                    obj_key = utils.make_key_from_instance(dg_obj_instance)
+                    coverage = estimate_screen_coverage(obj, dg_obj_instance.matrix_world, context)
+                    pending_objects.append((obj_key, PendingObject(dg_obj_instance, coverage)))
+
+                    if proxy_type == "SIMPLIFIED" and time() > simplified_proxy_deadline:
+                        # Converting the base meshes delays the first frame, so the work is capped
+                        proxy_type = "BOUNDING_BOX"
+                    if proxy_type != "NONE":
+                        self._convert_proxy(dg_obj_instance, obj, obj_key, depsgraph, luxcore_scene,
+                                            scene_props, proxy_type)
+                    continue
+
                 if engine:
                     if engine.test_break():
                         return None
@@ -295,9 +442,83 @@ class ObjectCache2:
                 self._convert_obj(exporter, dg_obj_instance, obj, depsgraph, luxcore_scene,
                                   scene_props, is_viewport_render, view_layer, engine)
 
+        pending_objects.sort(key=lambda item: item[1].coverage, reverse=True)
+        self.pending_objects = dict(pending_objects)
+
         #self._debug_info()
         return instances
 
+    def export_pending(self, exporter, depsgraph, luxcore_scene, scene_props, context, deadline):
+        """
+        Export the pending objects of the staged viewport export, largest screen coverage
+        first, until the deadline is reached. Objects that are not exported in time stay
+        pending for the next call, so the export can be interrupted after every object.
+        Returns the number of exported objects.
+        """
+        exported_count = 0
+
+        while self.pending_objects and time() < deadline:
+            # The dict preserves insertion order, so the first key has the largest coverage
+            obj_key = next(iter(self.pending_objects))
+            pending = self.pending_objects.pop(obj_key)
+
+            proxy = self.exported_objects.pop(obj_key, None)
+            if proxy:
+                proxy.delete(luxcore_scene)
+
+            # Objects that were deleted or hidden in the meantime are skipped
+            if not pending.resolve(depsgraph) or not utils.is_instance_visible(pending, pending.object, context):
+                continue
+
+            self._convert_obj(exporter, pending, pending.object, depsgraph, luxcore_scene, scene_props, True)
+            exported_count += 1
+
+        return exported_count
+
+    def remove_proxy_meshes(self, luxcore_scene):
+        """
+        Called when all pending objects of the staged export are exported and their props are parsed.
+        The stand-in objects were already deleted in export_pending(), this deletes their meshes.
+        RemoveUnusedMeshes() also deletes cached meshes that are not used by any object at the
+        moment (e.g. of hidden objects), so these are removed from the cache and converted again
+        when they are needed.
+        """
+        luxcore_scene.RemoveUnusedMeshes()
+        self.exported_proxies.clear()
+
+        for mesh_key, exported_mesh in list(self.exported_meshes.items()):
+            if exported_mesh and not all(luxcore_scene.IsMeshDefined(shape)
+                                         for shape, _ in exported_mesh.mesh_definitions):
+                del self.exported_meshes[mesh_key]
+
+        for psys_key, lux_shape in list(self.exported_hair.items()):
+            if not luxcore_scene.IsMeshDefined(lux_shape):
+                del self.exported_hair[psys_key]
+
+    def _convert_proxy(self, dg_obj_instance, obj, obj_key, depsgraph, luxcore_scene, scene_props, proxy_type):
+        """ Define a cheap stand-in for a mesh object that is exported later by export_pending() """
+        proxy_key = self._get_mesh_key(obj, True) + "_proxy"
+
+        try:
+            mesh_definitions = self.exported_proxies[proxy_key]
+        except KeyError:
+            if proxy_type == "BOUNDING_BOX":
+                mesh_definitions = define_bounding_box_mesh(obj, proxy_key, luxcore_scene)
+            else:
+                mesh_definitions = define_simplified_mesh(obj, proxy_key, depsgraph, luxcore_scene, scene_props)
+            self.exported_proxies[proxy_key] = mesh_definitions
+
+        if not mesh_definitions:
+            return
+
+        mat_names = [PROXY_MATERIAL_NAME] * len(mesh_definitions)
+        # The proxy is deleted in export_pending() when the full object is exported
+        exported_obj = ExportedObject(obj_key, mesh_definitions, mat_names, dg_obj_instance.matrix_world.copy(),
+                                      utils.visible_to_camera(dg_obj_instance, True),
+                                      utils.make_object_id(dg_obj_instance))
+        scene_props.Set(exported_obj.get_props())
+        self.exported_objects[obj_key] = exported_obj
+
     def duplicate_instances(self, instances, luxcore_scene, stats):
         """
         We can only duplicate the instances *after* the scene_props were parsed so the base
@@ -358,6 +579,7 @@ class ObjectCache2:
         obj_key = utils.make_key_from_instance(dg_obj_instance)
         exported_stuff = None
         props = pyluxcore.Properties()
+        has_hair = False
 
         if dg_obj_instance.show_self:
             if obj.type in MESH_OBJECTS:
@@ -411,11 +633,18 @@ class ObjectCache2:
                     # Should always be the case because lights can't have particle systems
                     assert isinstance(exported_stuff, ExportedObject)
                     exported_stuff.parts.append(ExportedPart(lux_obj, lux_shape, lux_mat))
+                    has_hair = True
 
         if exported_stuff:
             scene_props.Set(props)
             self.exported_objects[obj_key] = exported_stuff
 
+            if not is_viewport_render and isinstance(exported_stuff, ExportedObject) and obj.type in MESH_OBJECTS:
+                visibility_source = dg_obj_instance.parent if dg_obj_instance.is_instance else obj
+                # Duplicated objects and hair can't be redefined by a simple props update
+                editable = not dg_obj_instance.is_instance and not has_hair
+                self.camera_visibility_sources[obj_key] = (visibility_source.original, editable)
+
         return exported_stuff
 
     def _convert_mesh_obj(self, exporter, dg_obj_instance, obj, obj_key, depsgraph,
@@ -459,6 +688,26 @@ class ObjectCache2:
             return ExportedObject(obj_key, exported_mesh.mesh_definitions, mat_names, obj_transform,
                                   utils.visible_to_camera(dg_obj_instance, is_viewport_render, view_layer), obj_id)
 
+    def update_camera_visibility(self, view_layer, scene_props):
+        """
+        Apply the camera visibility of another view layer to the exported objects (final render only).
+        Returns False if an object that can't be redefined in place changed its visibility,
+        in this case the scene has to be exported again.
+        """
+        for obj_key, (visibility_source, editable) in self.camera_visibility_sources.items():
+            exported_obj = self.exported_objects[obj_key]
+            visible_to_camera = (visibility_source.luxcore.visible_to_camera
+                                 and not visibility_source.indirect_only_get(view_layer=view_layer))
+
+            if visible_to_camera == exported_obj.visible_to_camera:
+                continue
+            if not editable:
+                return False
+
+            exported_obj.visible_to_camera = visible_to_camera
+            scene_props.Set(exported_obj.get_props())
+        return True
+
     def diff(self, depsgraph):
         only_scene = len(depsgraph.updates) == 1 and isinstance(depsgraph.updates[0].id, bpy.types.Scene)
         return depsgraph.id_type_updated("OBJECT") and not only_scene
@@ -560,7 +809,7 @@ class ObjectCache2:
 
                 if updated:
                     scene_props.Set(exported_obj.get_props())
-            else:
+            elif obj_key not in self.pending_objects:
                 # Object is new and not in LuxCore yet, or it is a light, do a full export
                 self._convert_obj(exporter, dg_obj_instance, obj, depsgraph,
                                   luxcore_scene, scene_props, is_viewport_render)
@@ -11,6 +11,11 @@ from ..utils.errorlog import LuxCoreErrorLog
 from ..utils import view_layer as utils_view_layer
 from ..utils import get_addon_preferences
 
+# With automatic viewport resolution reduction, the block size is chosen so that
+# at most this many samples are rendered per frame right after an edit
+AUTO_RESOLUTION_REDUCTION_SAMPLES = 512 * 512
+MAX_RESOLUTION_REDUCTION = 16
+
 
 class SamplingOverlap:
     PROGRESSIVE = 1
@@ -109,6 +114,9 @@ def convert(exporter, scene, context=None, engine=None):
         # FILESAVER engine (only in final render)
         if use_filesaver:
             _convert_filesaver(scene, definitions, luxcore_engine)
+        elif config.use_checkpoints and not is_viewport_render:
+            # Needed for session.SaveResumeFile(), see utils/checkpoint.py
+            definitions["resumerendering.enable"] = True
 
         # CPU thread settings (we use the properties from Blender here)
         if scene.render.threads_mode == "FIXED":
@@ -180,7 +188,7 @@ def convert_viewport_engine(context, scene, definitions, config):
         device = "CPU"
 
     _convert_path(config, definitions, using_hybridbackforward, device, True, scene)
-    resolutionreduction = viewport.resolution_reduction if viewport.reduce_resolution_on_edit else 1
+    resolutionreduction = _calc_resolution_reduction(context, scene)
 
     if utils.using_bidir_in_viewport(scene):
         luxcore_engine = "BIDIRCPU"
@@ -224,7 +232,8 @@ def convert_viewport_engine(context, scene, definitions, config):
             """
 
             # TODO figure out good settings
-            # 4, 2, 2 seems to be quite ok for now. Maybe make resolutionreduction dependent on film size later.
+            # 4, 2, 2 seems to be quite ok for now. The preview block size can be made dependent
+            # on the film size with the automatic block size option.
             definitions["rtpath.resolutionreduction.preview"] = resolutionreduction
             definitions["rtpath.resolutionreduction.preview.step"] = 2
             definitions["rtpath.resolutionreduction"] = 2
@@ -234,6 +243,28 @@ def convert_viewport_engine(context, scene, definitions, config):
     return luxcore_engine, sampler
 
 
+def _calc_resolution_reduction(context, scene):
+    """
+    Block size of the first samples after a viewport edit. While the user is moving the camera or
+    objects, every frame starts with these coarse blocks, which are refined once the movement stops.
+    The film size is not changed, so no re-export is needed.
+    """
+    viewport = scene.luxcore.viewport
+    if not viewport.reduce_resolution_on_edit:
+        return 1
+    if not viewport.use_auto_resolution_reduction:
+        return viewport.resolution_reduction
+
+    width, height = utils.calc_filmsize(scene, context)
+    # Same minimum as the manual block size, smaller viewports still get a coarse preview
+    block_size = 2
+    while block_size < MAX_RESOLUTION_REDUCTION:
+        if (width * height) / block_size**2 <= AUTO_RESOLUTION_REDUCTION_SAMPLES:
+            break
+        block_size *= 2
+    return block_size
+
+
 def _convert_final_engine(scene, definitions, config):
     if config.engine == "PATH":
         # Specific settings for PATH and TILEPATH
@@ -342,32 +373,42 @@ def _convert_path(config, definitions, use_hybridbackforward, device, is_viewpor
         definitions["path.hybridbackforward.glossinessthreshold"] = path.hybridbackforward_glossinessthresh
 
 
-def _convert_filesaver(scene, definitions, luxcore_engine):
-    config = scene.luxcore.config
-
-    filesaver_path = config.filesaver_path
+def get_filesaver_dir(scene):
+    """ The directory that contains the exported frames """
+    filesaver_path = scene.luxcore.config.filesaver_path
     output_path = utils.get_abspath(filesaver_path, must_exist=True, must_be_existing_dir=True)
 
     blend_name = utils.get_blendfile_name()
     if not blend_name:
         blend_name = "Untitled"
 
-    dir_name = blend_name + "_LuxCore"
+    return os.path.join(output_path, blend_name + "_LuxCore")
+
+
+def get_filesaver_frame_path(scene, view_layer=None):
+    """ The .bcf file (binary format) or the directory (text format) of the current frame """
     frame_name = "%05d" % scene.frame_current
 
     # If we have multiple render layers, we append the layer name
-    if len(scene.view_layers) > 1:
-        # TODO 2.8
-        render_layer = utils_view_layer.get_current_view_layer(scene)
-        frame_name += "_" + render_layer.name
+    if len(scene.view_layers) > 1 and view_layer:
+        frame_name += "_" + view_layer.name
 
-    if config.filesaver_format == "BIN":
+    if scene.luxcore.config.filesaver_format == "BIN":
         # For binary format, the frame number is used as file name instead of directory name
         frame_name += ".bcf"
-        output_path = os.path.join(output_path, dir_name)
+    # For text format, we use the frame number as name for a subfolder
+    return os.path.join(get_filesaver_dir(scene), frame_name)
+
+
+def _convert_filesaver(scene, definitions, luxcore_engine):
+    config = scene.luxcore.config
+    # TODO 2.8
+    frame_path = get_filesaver_frame_path(scene, utils_view_layer.get_current_view_layer(scene))
+
+    if config.filesaver_format == "BIN":
+        output_path = os.path.dirname(frame_path)
     else:
-        # For text format, we use the frame number as name for a subfolder
-        output_path = os.path.join(output_path, dir_name, frame_name)
+        output_path = frame_path
 
     if not os.path.exists(output_path):
         # https://stackoverflow.com/a/273227
@@ -378,7 +419,7 @@ def _convert_filesaver(scene, definitions, luxcore_engine):
                 raise
 
     if config.filesaver_format == "BIN":
-        definitions["filesaver.filename"] = os.path.join(output_path, frame_name)
+        definitions["filesaver.filename"] = frame_path
     else:
         # Text format
         definitions["filesaver.directory"] = output_path
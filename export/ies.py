@@ -0,0 +1,89 @@
+import tempfile
+import hashlib
+import os
+
+
+class IESExporter(object):
+    """
+    This class is a singleton.
+    IES profiles from Blender text blocks are written to a cache directory,
+    once per distinct content. All lights using the same profile reference
+    the same file, so the properties and the LuxCore scene hold only one copy.
+    """
+    cache_dir = None
+    # {content_hash: filepath}
+    exported_profiles = {}
+    # Profiles of the text blocks in the current export, so lights sharing a text block
+    # don't read and hash it again. {text name: filepath}, cleared by begin_export()
+    text_profiles = {}
+
+    @classmethod
+    def begin_export(cls):
+        """ Text blocks might have been edited since the last export """
+        cls.text_profiles.clear()
+
+    @classmethod
+    def _get_cache_dir(cls):
+        if cls.cache_dir is None or not os.path.isdir(cls.cache_dir):
+            cls.cache_dir = tempfile.mkdtemp(prefix="luxcore_ies_")
+            cls.exported_profiles.clear()
+        return cls.cache_dir
+
+    @classmethod
+    def export_text(cls, text):
+        """
+        text is a bpy.types.Text containing the IES data.
+        Returns the path to the cached .ies file, or None if the text is empty.
+        """
+        try:
+            filepath = cls.text_profiles[text.name_full]
+            if filepath is None or os.path.isfile(filepath):
+                return filepath
+        except KeyError:
+            pass
+
+        filepath = cls._export_blob(text.as_string().encode("ascii"), text.name)
+        cls.text_profiles[text.name_full] = filepath
+        return filepath
+
+    @classmethod
+    def _export_blob(cls, blob, text_name):
+        if not blob:
+            return None
+
+        content_hash = hashlib.sha1(blob).hexdigest()
+
+        try:
+            filepath = cls.exported_profiles[content_hash]
+            if os.path.isfile(filepath):
+                return filepath
+        except KeyError:
+            pass
+
+        cache_dir = cls._get_cache_dir()
+        filepath = os.path.join(cache_dir, content_hash + ".ies")
+        # Write to a temporary file first so LuxCore never reads a half-written profile.
+        # The name is unique, other processes might write the same profile at the same time.
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+            f.write(blob)
+        os.replace(f.name, filepath)
+
+        print('Exported IES profile from text "%s" to "%s"' % (text_name, filepath))
+        cls.exported_profiles[content_hash] = filepath
+        return filepath
+
+    @classmethod
+    def cleanup(cls):
+        for filepath in cls.exported_profiles.values():
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        cls.exported_profiles.clear()
+        cls.text_profiles.clear()
+
+        if cls.cache_dir and os.path.isdir(cls.cache_dir):
+            print("Deleting IES cache directory:", cls.cache_dir)
+            try:
+                os.rmdir(cls.cache_dir)
+            except OSError:
+                pass
+        cls.cache_dir = None
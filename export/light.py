@@ -5,6 +5,7 @@ from ..bin import pyluxcore
 from .. import utils
 from .caches.exported_data import ExportedObject, ExportedLight
 from .image import ImageExporter
+from .ies import IESExporter
 from ..utils.errorlog import LuxCoreErrorLog
 from ..utils import node as utils_node
 from ..nodes.output import get_active_output
@@ -12,6 +13,11 @@ from ..nodes.output import get_active_output
 WORLD_BACKGROUND_LIGHT_NAME = "__WORLD_BACKGROUND_LIGHT__"
 MISSING_IMAGE_COLOR = [1, 0, 1]
 TYPES_SUPPORTING_ENVLIGHTCACHE = {"sky2", "infinite", "constantinfinite"}
+# All area lights share this mesh and only differ by object transformation and material
+AREA_LIGHT_SHAPE_NAME = "__AREA_LIGHT_UNIT_QUAD__"
+# Light types whose definitions only depend on the light datablock and the transformation
+TEMPLATE_LIGHT_TYPES = {"POINT", "SPOT"}
+SPOT_FIX = Matrix.Rotation(math.radians(-90.0), 4, "Z")
 
 
 def convert_light(exporter, obj, obj_key, depsgraph, luxcore_scene, transform, is_viewport_render):
@@ -19,6 +25,11 @@ def convert_light(exporter, obj, obj_key, depsgraph, luxcore_scene, transform, i
         luxcore_name = obj_key
         scene = depsgraph.scene_eval
 
+        if not is_viewport_render and obj.data.type in TEMPLATE_LIGHT_TYPES:
+            # Fast path for scenes with thousands of point and spot lights
+            return _convert_light_from_template(exporter, obj, depsgraph, luxcore_scene, transform,
+                                                luxcore_name, scene)
+
         # If this light was previously defined as an area lamp, delete the area lamp mesh
         luxcore_scene.DeleteObject(_get_area_obj_name(luxcore_name))
         # If this light was previously defined as a light, delete it
@@ -40,6 +51,38 @@ def convert_light(exporter, obj, obj_key, depsgraph, luxcore_scene, transform, i
         return pyluxcore.Properties(), None
 
 
+def _convert_light_from_template(exporter, obj, depsgraph, luxcore_scene, transform, luxcore_name, scene):
+    """
+    Point and spot lights using the same light datablock only differ by their transformation.
+    The definitions are converted once per datablock (including image, IES and lightgroup lookups)
+    and then re-used for all lights, e.g. thousands of instanced street lamps.
+    Only used in final render, where the light settings can't change during the export.
+    """
+    light = obj.data
+    key = utils.make_key(light)
+
+    try:
+        template = exporter.light_template_cache[key]
+    except KeyError:
+        identity = Matrix.Identity(4)
+        if light.luxcore.use_cycles_settings:
+            template, _ = _convert_cycles_light(exporter, obj, depsgraph, luxcore_scene, identity, False,
+                                                luxcore_name, scene, None)
+        else:
+            template, _ = _convert_luxcore_light(exporter, obj, depsgraph, luxcore_scene, identity, False,
+                                                 luxcore_name, scene, None)
+        exporter.light_template_cache[key] = template
+
+    if light.type == "SPOT":
+        transform = transform @ SPOT_FIX
+
+    definitions = template.copy()
+    definitions["transformation"] = utils.matrix_to_list(transform)
+
+    prefix = "scene.lights." + luxcore_name + "."
+    return utils.create_props(prefix, definitions), ExportedLight(luxcore_name)
+
+
 def _convert_cycles_light(exporter, obj, depsgraph, luxcore_scene, transform, is_viewport_render,
                           luxcore_name, scene, prefix):
     definitions = {}
@@ -111,8 +154,7 @@ def _convert_cycles_light(exporter, obj, depsgraph, luxcore_scene, transform, is
         definitions["position"] = [0, 0, 0]
         definitions["target"] = [0, 0, -1]
 
-        spot_fix = Matrix.Rotation(math.radians(-90.0), 4, "Z")
-        definitions["transformation"] = utils.matrix_to_list(transform @ spot_fix)
+        definitions["transformation"] = utils.matrix_to_list(transform @ SPOT_FIX)
 
         # Multiplier to reach similar brightness as Cycles, found by eyeballing.
         gain *= 0.07
@@ -153,10 +195,9 @@ def _convert_cycles_light(exporter, obj, depsgraph, luxcore_scene, transform, is
         props.Set(mat_props)
 
         # Object
-        use_instancing = utils.use_instancing(obj, scene, is_viewport_render)
         visible_to_camera = False
-        obj_props, exported_obj = _create_luxcore_meshlight(obj, transform, use_instancing, luxcore_name,
-                                                            luxcore_scene, mat_name, visible_to_camera)
+        obj_props, exported_obj = _create_luxcore_meshlight(obj, transform, luxcore_name, luxcore_scene,
+                                                            mat_name, visible_to_camera)
         props.Set(obj_props)
         return props, exported_obj
     else:
@@ -173,6 +214,10 @@ def _convert_cycles_light(exporter, obj, depsgraph, luxcore_scene, transform, is
     if not light.cycles.cast_shadow:
         LuxCoreErrorLog.add_warning("Cast Shadow is disabled, but unsupported by LuxCore", obj.name)
 
+    if prefix is None:
+        # Creating a light template, see _convert_light_from_template()
+        return definitions, None
+
     props = utils.create_props(prefix, definitions)
     return props, ExportedLight(luxcore_name)
 
@@ -215,7 +260,8 @@ def _convert_luxcore_light(exporter, obj, depsgraph, luxcore_scene, transform, i
 
             has_ies = False
             try:
-                has_ies = export_ies(definitions, light.luxcore.ies, light.library)
+                has_ies = export_ies(definitions, light.luxcore.ies, light.library,
+                                     embed_text=utils.using_filesaver(is_viewport_render, scene))
             except OSError as error:
                 msg = 'Light "%s": %s' % (obj.name, error)
                 LuxCoreErrorLog.add_warning(msg, obj_name=obj.name)
@@ -306,8 +352,7 @@ def _convert_luxcore_light(exporter, obj, depsgraph, luxcore_scene, transform, i
         definitions["position"] = [0, 0, 0]
         definitions["target"] = [0, 0, -1]
 
-        spot_fix = Matrix.Rotation(math.radians(-90.0), 4, "Z")
-        definitions["transformation"] = utils.matrix_to_list(transform @ spot_fix)
+        definitions["transformation"] = utils.matrix_to_list(transform @ SPOT_FIX)
 
     elif light.type == "AREA":
         if light.luxcore.is_laser:
@@ -321,8 +366,7 @@ def _convert_luxcore_light(exporter, obj, depsgraph, luxcore_scene, transform, i
             definitions["position"] = [0, 0, 0]
             definitions["target"] = [0, 0, -1]
 
-            spot_fix = Matrix.Rotation(math.radians(-90.0), 4, "Z")
-            definitions["transformation"] = utils.matrix_to_list(transform @ spot_fix)
+            definitions["transformation"] = utils.matrix_to_list(transform @ SPOT_FIX)
         else:
             # area (mesh light)
             return _convert_area_light(obj, scene, is_viewport_render, exporter, depsgraph, luxcore_scene, gain,
@@ -337,6 +381,10 @@ def _convert_luxcore_light(exporter, obj, depsgraph, luxcore_scene, transform, i
     if not is_viewport_render and definitions["type"] in TYPES_SUPPORTING_ENVLIGHTCACHE:
         _envlightcache(definitions, light, scene, is_viewport_render)
 
+    if prefix is None:
+        # Creating a light template, see _convert_light_from_template()
+        return definitions, None
+
     props = utils.create_props(prefix, definitions)
     return props, ExportedLight(luxcore_name)
 
@@ -623,8 +671,55 @@ def _get_area_obj_name(luxcore_name):
     return luxcore_name + str(fake_material_index)
 
 
-def _create_luxcore_meshlight(obj, transform, use_instancing, luxcore_name, luxcore_scene,
-                              mat_name, visible_to_camera):
+def is_area_meshlight(obj):
+    """
+    Returns True if the light is exported as an object with emissive material
+    (i.e. it is an ExportedObject that can be duplicated like a mesh)
+    """
+    if obj.type != "LIGHT" or obj.data.type != "AREA":
+        return False
+
+    light = obj.data
+    if light.luxcore.use_cycles_settings:
+        return not light.cycles.is_portal
+    else:
+        return not light.luxcore.is_laser
+
+
+def _define_area_light_shape(luxcore_scene):
+    """
+    Define the unit quad that is shared by all area lights. The size of the
+    light is part of the object transformation (see calc_area_light_transformation).
+    """
+    if luxcore_scene.IsMeshDefined(AREA_LIGHT_SHAPE_NAME):
+        return
+
+    vertices = [
+        (1, 1, 0),
+        (1, -1, 0),
+        (-1, -1, 0),
+        (-1, 1, 0),
+    ]
+    faces = [
+        (0, 1, 2),
+        (2, 3, 0),
+    ]
+    normals = [
+        (0, 0, -1),
+        (0, 0, -1),
+        (0, 0, -1),
+        (0, 0, -1),
+    ]
+    uvs = [
+        (1, 1),
+        (1, 0),
+        (0, 0),
+        (0, 1),
+    ]
+    luxcore_scene.DefineMesh(AREA_LIGHT_SHAPE_NAME, vertices, faces, normals, uvs, None, None, None)
+
+
+def _create_luxcore_meshlight(obj, transform, luxcore_name, luxcore_scene, mat_name, visible_to_camera):
     light = obj.data
     transform_matrix = calc_area_light_transformation(light, transform)
     if light.shape not in {"SQUARE", "RECTANGLE"}:
@@ -635,60 +730,25 @@ def _create_luxcore_meshlight(obj, transform, use_instancing, luxcore_name, luxc
         # This happens if the light size is set to 0
         raise Exception("Area light has size 0 (can not be exported)")
 
-    transform_list = utils.matrix_to_list(transform_matrix)
-    # Only bake the transform into the mesh for final renders (disables instancing which
-    # is needed for viewport render so we can move the light object)
-
-    # Instancing just means that we transform the object instead of the mesh
-    if use_instancing:
-        obj_transform = transform_list
-        mesh_transform = None
-    else:
-        obj_transform = None
-        mesh_transform = transform_list
-
-    shape_name = luxcore_name
-    if not luxcore_scene.IsMeshDefined(shape_name):
-        vertices = [
-            (1, 1, 0),
-            (1, -1, 0),
-            (-1, -1, 0),
-            (-1, 1, 0),
-        ]
-        faces = [
-            (0, 1, 2),
-            (2, 3, 0),
-        ]
-        normals = [
-            (0, 0, -1),
-            (0, 0, -1),
-            (0, 0, -1),
-            (0, 0, -1),
-        ]
-        uvs = [
-            (1, 1),
-            (1, 0),
-            (0, 0),
-            (0, 1),
-        ]
-        luxcore_scene.DefineMesh(shape_name, vertices, faces, normals, uvs, None, None, mesh_transform)
+    # The transformation is never baked into the mesh, instead all area lights are
+    # instances of the same unit quad. This avoids defining thousands of tiny meshes
+    # in scenes with many area lights, and we can move the light in viewport render.
+    _define_area_light_shape(luxcore_scene)
 
     fake_material_index = 0
     # The material index after the luxcore_name is expected by ExportedObject
     obj_prefix = "scene.objects." + _get_area_obj_name(luxcore_name) + "."
     obj_definitions = {
         "material": mat_name,
-        "shape": shape_name,
+        "shape": AREA_LIGHT_SHAPE_NAME,
         "camerainvisible": not visible_to_camera,
+        "transformation": utils.matrix_to_list(transform_matrix),
     }
-    if obj_transform:
-        # Use instancing for viewport render so we can interactively move the light
-        obj_definitions["transformation"] = obj_transform
 
     obj_props = utils.create_props(obj_prefix, obj_definitions)
 
-    mesh_definition = [luxcore_name, fake_material_index]
-    exported_obj = ExportedObject(luxcore_name, [mesh_definition], ["fake_mat_name"],
+    mesh_definition = [AREA_LIGHT_SHAPE_NAME, fake_material_index]
+    exported_obj = ExportedObject(luxcore_name, [mesh_definition], [mat_name],
                                   transform.copy(), visible_to_camera)
     return obj_props, exported_obj
 
@@ -788,7 +848,8 @@ def _convert_area_light(obj, scene, is_viewport_render, exporter, depsgraph, lux
     # IES data
     if light.luxcore.ies.use:
         try:
-            export_ies(mat_definitions, light.luxcore.ies, light.library, is_meshlight=True)
+            export_ies(mat_definitions, light.luxcore.ies, light.library, is_meshlight=True,
+                       embed_text=utils.using_filesaver(is_viewport_render, scene))
         except OSError as error:
             msg = 'light "%s": %s' % (obj.name, error)
             LuxCoreErrorLog.add_warning(msg, obj_name=obj.name)
@@ -797,10 +858,9 @@ def _convert_area_light(obj, scene, is_viewport_render, exporter, depsgraph, lux
     props.Set(mat_props)
 
     # LuxCore object
-    use_instancing = utils.use_instancing(obj, scene, is_viewport_render)
     visible_to_camera = obj.luxcore.visible_to_camera and light.luxcore.visible
-    obj_props, exported_obj = _create_luxcore_meshlight(obj, transform, use_instancing, luxcore_name,
-                                                        luxcore_scene, mat_name, visible_to_camera)
+    obj_props, exported_obj = _create_luxcore_meshlight(obj, transform, luxcore_name, luxcore_scene,
+                                                        mat_name, visible_to_camera)
     props.Set(obj_props)
     return props, exported_obj
 
@@ -900,7 +960,7 @@ def _define_brightness_and_color(light, definitions):
         raise Exception("Unkown color mode")
 
 
-def export_ies(definitions, ies, library, is_meshlight=False):
+def export_ies(definitions, ies, library, is_meshlight=False, embed_text=False):
     """
     ies is a LuxCoreIESProps PropertyGroup
     """
@@ -914,16 +974,24 @@ def export_ies(definitions, ies, library, is_meshlight=False):
     definitions[prefix + "map.width"] = ies.map_width
     definitions[prefix + "map.height"] = ies.map_height
 
-    # There are two ways to specify IES data: filepath or blob (ascii text)
+    # There are two ways to specify IES data: filepath or Blender text block.
+    # Text blocks are written to a cache file (once per distinct profile) that can be
+    # shared by all lights. The cache is deleted when Blender exits, so if embed_text
+    # is set (filesaver export), the text is passed as blob instead.
     if ies.file_type == "TEXT":
         # Blender text block
         text = ies.file_text
 
-        if text:
+        if text and embed_text:
             blob = text.as_string().encode("ascii")
 
             if blob:
                 definitions[prefix + "iesblob"] = [blob]
+        elif text:
+            filepath = IESExporter.export_text(text)
+
+            if filepath:
+                definitions[prefix + "iesfile"] = filepath
     else:
         # File path
         iesfile = ies.file_path
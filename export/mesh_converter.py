@@ -41,10 +41,12 @@ def get_custom_normals_slow(mesh):
     return custom_normals
 
 
-def convert(obj, mesh_key, depsgraph, luxcore_scene, is_viewport_render, use_instancing, transform, exporter=None):
+def convert(obj, mesh_key, depsgraph, luxcore_scene, is_viewport_render, use_instancing, transform, exporter=None,
+            use_modifiers=True):
+    """ If use_modifiers is False, the base mesh of the object is converted (used for viewport proxies) """
     start_time = time()
     
-    with _prepare_mesh(obj, depsgraph) as mesh:
+    with _prepare_mesh(obj, depsgraph, use_modifiers) as mesh:
         if mesh is None:
             return None
         
@@ -97,7 +99,7 @@ def convert(obj, mesh_key, depsgraph, luxcore_scene, is_viewport_render, use_ins
 
 
 @contextmanager
-def _prepare_mesh(obj, depsgraph):
+def _prepare_mesh(obj, depsgraph, use_modifiers=True):
     """
     Create a temporary mesh from an object.
     The mesh is guaranteed to be removed when the calling block ends.
@@ -115,7 +117,8 @@ def _prepare_mesh(obj, depsgraph):
     object_eval = None
 
     try:
-        object_eval = obj.evaluated_get(depsgraph)
+        # The original object returns its mesh without modifiers
+        object_eval = obj.evaluated_get(depsgraph) if use_modifiers else obj.original
         if object_eval:
             mesh = object_eval.to_mesh()
 
@@ -2,10 +2,9 @@ import math
 from ..bin import pyluxcore
 from .. import utils
 from .caches.exported_data import ExportedObject, ExportedLight
+from .light import calc_area_light_transformation
 
 
-# TODO fix motion blur of area lights, they get a wrong transformation
-
 def convert(context, engine, scene, depsgraph, exported_objects):
     assert scene.camera
     motion_blur = scene.camera.data.luxcore.motion_blur
@@ -84,6 +83,9 @@ def _append_object_matrices(depsgraph, exported_objects, matrices, step):
 
         obj_key = utils.make_key_from_instance(dg_obj_instance)
         matrix = obj.matrix_world
+        if obj.type == "LIGHT" and obj.data.type == "AREA":
+            # Area lights are instances of a unit quad, the size is part of the transformation
+            matrix = calc_area_light_transformation(obj.data, matrix)
 
         try:
             exported_thing = exported_objects[obj_key]
@@ -2,12 +2,16 @@ import bpy
 import blf
 from bgl import *
 import gpu
+import numpy as np
 from gpu_extras.batch import batch_for_shader
 
 handle = None
 
 
 class TileStats:
+    # Incremented whenever the tile data changes, cached batches are rebuilt afterwards
+    version = 0
+
     @classmethod
     def reset(cls):
         cls.width = 0
@@ -20,6 +24,11 @@ class TileStats:
         cls.converged_passcounts = []
         cls.notconverged_coords = []
         cls.notconverged_passcounts = []
+        cls.version += 1
+
+
+# One line batch per tile state, {state: (TileStats.version, batch)}
+_batch_cache = {}
 
 
 def handler():
@@ -44,66 +53,96 @@ def _tile_highlight(context):
     view_to_region = context.region.view2d.view_to_region
     display = context.scene.luxcore.display
 
+    # The view transform is affine, so the tiles can be stored in relative coords (range 0..1)
+    # and transformed when drawing. This way, the batches stay valid when the view changes.
+    origin_x, origin_y = view_to_region(0, 0, clip=False)
+    end_x, end_y = view_to_region(1, 1, clip=False)
+    transform = (origin_x, origin_y, end_x - origin_x, end_y - origin_y)
+    region_size = (context.region.width, context.region.height)
+    shader = gpu.shader.from_builtin('2D_UNIFORM_COLOR')
+
     if display.show_converged:
         passcounts = TileStats.converged_passcounts if display.show_passcounts else []
-        _draw_tiles(TileStats.converged_coords, passcounts, (0, 1, 0, 1), view_to_region)
+        _draw_tiles("CONVERGED", TileStats.converged_coords, passcounts, (0, 1, 0, 1),
+                    shader, transform, region_size)
 
     if display.show_notconverged:
         passcounts = TileStats.notconverged_passcounts if display.show_passcounts else []
-        _draw_tiles(TileStats.notconverged_coords, passcounts, (1, 0, 0, 1), view_to_region)
+        _draw_tiles("NOTCONVERGED", TileStats.notconverged_coords, passcounts, (1, 0, 0, 1),
+                    shader, transform, region_size)
 
     if display.show_pending:
         passcounts = TileStats.pending_passcounts if display.show_passcounts else []
-        _draw_tiles(TileStats.pending_coords, passcounts, (1, 1, 0, 1), view_to_region)
+        _draw_tiles("PENDING", TileStats.pending_coords, passcounts, (1, 1, 0, 1),
+                    shader, transform, region_size)
 
 
-def _draw_tiles(coords, passcounts, color, view_to_region):
+def _draw_tiles(state, coords, passcounts, color, shader, transform, region_size):
     if not coords or TileStats.film_width == 0 or TileStats.film_height == 0:
         return
 
-    for i in range(len(coords) // 2):
-        # Pixel coords
-        x = coords[i * 2]
-        y = coords[i * 2 + 1]
-        width = min(TileStats.width, TileStats.film_width - x)
-        height = min(TileStats.height, TileStats.film_height - y)
+    batch = _get_batch(state, coords, shader)
+    offset_x, offset_y, scale_x, scale_y = transform
 
-        # Relative coords in range 0..1
-        rel_x = x / TileStats.film_width
-        rel_y = y / TileStats.film_height
-        rel_width = width / TileStats.film_width
-        rel_height = height / TileStats.film_height
+    with gpu.matrix.push_pop():
+        gpu.matrix.translate((offset_x, offset_y))
+        gpu.matrix.scale((scale_x, scale_y))
+        shader.bind()
+        shader.uniform_float("color", color)
+        batch.draw(shader)
 
-        _draw_rect(rel_x, rel_y, rel_width, rel_height, color, view_to_region)
+    if passcounts:
+        _draw_texts(coords, passcounts, color, transform, region_size)
 
-        if passcounts:
-            _draw_text(str(passcounts[i]), rel_x, rel_y, color, view_to_region)
 
-def _draw_rect(x, y, width, height, color, view_to_region):
-    x1, y1 = view_to_region(x, y, clip=False)
-    x2, y2 = view_to_region(x + width, y, clip=False)
-    x3, y3 = view_to_region(x + width, y + height, clip=False)
-    x4, y4 = view_to_region(x, y + height, clip=False)
+def _get_batch(state, coords, shader):
+    """ All tile outlines of one state in a single line batch, cached until TileStats changes """
+    cached = _batch_cache.get(state)
+    if cached and cached[0] == TileStats.version:
+        return cached[1]
 
-    co = ((x1, y1), (x2, y2), (x3, y3), (x4, y4))
-    indices = ((0, 1), (1, 2), (2, 3), (3, 0))
+    # Pixel coords
+    pixel_coords = np.array(coords, dtype=np.float32).reshape(-1, 2)
+    x = pixel_coords[:, 0]
+    y = pixel_coords[:, 1]
+    width = np.minimum(TileStats.width, TileStats.film_width - x)
+    height = np.minimum(TileStats.height, TileStats.film_height - y)
+
+    # Relative coords in range 0..1
+    x1 = x / TileStats.film_width
+    y1 = y / TileStats.film_height
+    x2 = (x + width) / TileStats.film_width
+    y2 = (y + height) / TileStats.film_height
+
+    tile_count = len(pixel_coords)
+    co = np.stack((x1, y1, x2, y1, x2, y2, x1, y2), axis=1).reshape(-1, 2)
+    corner_indices = np.array(((0, 1), (1, 2), (2, 3), (3, 0)), dtype=np.int32)
+    indices = (np.arange(tile_count, dtype=np.int32)[:, None, None] * 4 + corner_indices).reshape(-1, 2)
 
-    shader = gpu.shader.from_builtin('2D_UNIFORM_COLOR')
     batch = batch_for_shader(shader, 'LINES', {"pos": co}, indices=indices)
-    shader.bind()
-    shader.uniform_float("color", color)
-    batch.draw(shader)
+    _batch_cache[state] = (TileStats.version, batch)
+    return batch
 
 
-def _draw_text(text, x, y, color, view_to_region):
+def _draw_texts(coords, passcounts, color, transform, region_size):
     font_id = 0
     dpi = 72
     text_size = 12
     offset = 5
-    pixelpos_x, pixelpos_y = view_to_region(x, y, clip=False)
+    offset_x, offset_y, scale_x, scale_y = transform
+    region_width, region_height = region_size
 
     r, g, b, a = color
-    blf.position(font_id, pixelpos_x + offset, pixelpos_y + offset, 0)
-    blf.color(font_id, r,g,b,a)
+    blf.color(font_id, r, g, b, a)
     blf.size(font_id, text_size, dpi)
-    blf.draw(font_id, text)
+
+    for i in range(len(coords) // 2):
+        pixelpos_x = offset_x + coords[i * 2] / TileStats.film_width * scale_x + offset
+        pixelpos_y = offset_y + coords[i * 2 + 1] / TileStats.film_height * scale_y + offset
+
+        # Skip labels outside of the visible region
+        if not (-text_size * 4 < pixelpos_x < region_width and -text_size < pixelpos_y < region_height):
+            continue
+
+        blf.position(font_id, pixelpos_x, pixelpos_y, 0)
+        blf.draw(font_id, str(passcounts[i]))
@@ -1,10 +1,12 @@
 from ..export.image import ImageExporter
+from ..export.ies import IESExporter
 from ..draw.viewport import TempfileManager
 from ..bin import pyluxcore
 
 
 def handler():
     ImageExporter.cleanup()
+    IESExporter.cleanup()
     TempfileManager.cleanup()
 
     # Workaround for a bug in LuxCore:
@@ -185,7 +185,8 @@ class LuxCoreNodeMatEmission(bpy.types.Node, LuxCoreNode):
 
         if self.ies.use:
             try:
-                light.export_ies(definitions, self.ies, self.id_data.library, is_meshlight=True)
+                light.export_ies(definitions, self.ies, self.id_data.library, is_meshlight=True,
+                                 embed_text=exporter.scene.luxcore.config.use_filesaver)
             except OSError as error:
                 msg = 'Node "%s" in tree "%s": %s' % (self.name, self.id_data.name, error)
                 LuxCoreErrorLog.add_warning(msg)
@@ -0,0 +1,168 @@
+import bpy
+import os
+from bpy.props import IntProperty
+from os.path import dirname, join, realpath
+from time import sleep, time
+from .utils import BackgroundWorkerPool
+
+WORKER_SCRIPT = join(dirname(dirname(realpath(__file__))), "scripts", "animation_render_worker.py")
+# Used to choose the worker count if it is not set by the user
+AUTO_THREADS_PER_WORKER = 16
+
+
+class AnimationRenderPool(BackgroundWorkerPool):
+    """ Renders frames with several background Blender processes, each using a part of the CPU threads """
+    def __init__(self, blendfile, frames, worker_count, threads_per_worker):
+        super().__init__(blendfile, frames, worker_count, WORKER_SCRIPT,
+                         script_args=[threads_per_worker], prefix="luxcore_animation_")
+
+    def get_worker_stats(self):
+        """ Returns [(rendered frame count, render time)] for each worker """
+        stats = [[0, 0] for _ in self.workers]
+        for result in self.results.values():
+            if result["error"] or result["skipped"]:
+                continue
+            worker_stats = stats[result["worker"]]
+            worker_stats[0] += 1
+            worker_stats[1] += result["render_time"]
+        return [tuple(worker_stats) for worker_stats in stats]
+
+
+class LUXCORE_OT_render_animation_parallel(bpy.types.Operator):
+    """
+    Can also be used headless, e.g. on a render farm:
+    blender -b file.blend --python-expr "import bpy; bpy.ops.luxcore.render_animation_parallel(worker_count=8)"
+    """
+    bl_idname = "luxcore.render_animation_parallel"
+    bl_label = "Render Animation in Parallel"
+    bl_description = ("Render several frames of the animation at the same time in background Blender "
+                      "processes, each with a part of the CPU threads. Faster than a normal animation "
+                      "render if the frames are quick to render, because export and session start are "
+                      "mostly single-threaded")
+
+    worker_count: IntProperty(name="Workers", default=0, min=0,
+                              description="Number of parallel Blender processes "
+                                          "(0: one per %d CPU threads)" % AUTO_THREADS_PER_WORKER)
+    threads_per_worker: IntProperty(name="Threads per Worker", default=0, min=0,
+                                    description="CPU threads used by each worker "
+                                                "(0: the CPU threads are distributed evenly)")
+
+    _timer = None
+    _pool = None
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.render.engine == "LUXCORE"
+
+    def invoke(self, context, event):
+        self._pool = self._start_pool(context)
+        if self._pool is None:
+            return {"CANCELLED"}
+
+        self._timer = context.window_manager.event_timer_add(1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self._pool.cancel()
+            self._finish(context)
+            self.report({"WARNING"}, "Animation render cancelled")
+            return {"CANCELLED"}
+
+        if event.type == "TIMER":
+            finished = self._update(context)
+            if finished:
+                return self._finish(context)
+
+        return {"PASS_THROUGH"}
+
+    def execute(self, context):
+        # Blocking version for background mode
+        self._pool = self._start_pool(context)
+        if self._pool is None:
+            return {"CANCELLED"}
+
+        while not self._update(context):
+            sleep(1)
+        return self._finish(context)
+
+    def _start_pool(self, context):
+        scene = context.scene
+        config = scene.luxcore.config
+
+        if not bpy.data.is_saved or bpy.data.is_dirty:
+            self.report({"ERROR"}, "Save the .blend file first, the workers load it from disk")
+            return None
+        if scene.render.is_movie_format:
+            self.report({"ERROR"}, "Movie formats can't be written by several processes, use an image format")
+            return None
+        if config.engine == "PATH" and config.device == "OCL":
+            self.report({"ERROR"}, "Only CPU rendering is supported, the workers would share the GPUs")
+            return None
+        if config.use_filesaver:
+            self.report({"ERROR"}, 'Use "Export Frame Range" in the filesaver panel instead')
+            return None
+        if not _has_halt_condition(scene):
+            # The workers render single frames, so the render engine does not enforce one
+            self.report({"ERROR"}, "Set a halt condition, otherwise the first frame renders forever")
+            return None
+
+        cpu_threads = os.cpu_count()
+        worker_count = self.worker_count or max(1, cpu_threads // AUTO_THREADS_PER_WORKER)
+        frames = list(range(scene.frame_start, scene.frame_end + 1, scene.frame_step))
+        worker_count = min(worker_count, len(frames))
+        threads_per_worker = self.threads_per_worker or max(1, cpu_threads // worker_count)
+
+        print("[Animation] Rendering %d frames with %d workers, %d threads each"
+              % (len(frames), worker_count, threads_per_worker))
+        return AnimationRenderPool(bpy.data.filepath, frames, worker_count, threads_per_worker)
+
+    def _update(self, context):
+        new_results, finished = self._pool.poll()
+
+        for result in new_results:
+            if result["error"]:
+                print("[Animation] Frame %d failed: %s" % (result["frame"], result["error"]))
+            elif result["skipped"]:
+                print('[Animation] Frame %d skipped, "%s" already exists' % (result["frame"], result["path"]))
+            else:
+                print("[Animation] Frame %d rendered in %.1f s (worker %d)"
+                      % (result["frame"], result["render_time"], result["worker"]))
+
+        if context.workspace:
+            context.workspace.status_text_set("Animation render: %d/%d frames (Esc to cancel)"
+                                              % (len(self._pool.results), len(self._pool.frames)))
+        return finished
+
+    def _finish(self, context):
+        if self._timer:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        if context.workspace:
+            context.workspace.status_text_set(None)
+
+        total_time = time() - self._pool.start_time
+        for index, (frame_count, render_time) in enumerate(self._pool.get_worker_stats()):
+            frames_per_minute = frame_count / total_time * 60
+            print("[Animation] Worker %d: %d frames, %.1f s per frame, %.2f frames per minute"
+                  % (index, frame_count, render_time / max(frame_count, 1), frames_per_minute))
+
+        failed_frames = self._pool.get_failed_frames()
+        if failed_frames:
+            self.report({"ERROR"}, "%d frames failed, see the worker logs in %s"
+                        % (len(failed_frames), self._pool.temp_dir))
+            return {"CANCELLED"}
+
+        self.report({"INFO"}, "Rendered %d frames in %.1f s" % (len(self._pool.frames), total_time))
+        return {"FINISHED"}
+
+
+def _has_halt_condition(scene):
+    if scene.luxcore.halt.is_enabled():
+        return True
+
+    enabled_layers = [layer for layer in scene.view_layers if layer.use]
+    if not enabled_layers:
+        return False
+    return all(layer.luxcore.halt.enable and layer.luxcore.halt.is_enabled() for layer in enabled_layers)
@@ -0,0 +1,141 @@
+import bpy
+import json
+import os
+from bpy.props import IntProperty
+from os.path import dirname, join, realpath
+from time import sleep, time
+from .utils import BackgroundWorkerPool
+from ..export.config import get_filesaver_dir
+from ..utils import filesaver as utils_filesaver
+
+WORKER_SCRIPT = join(dirname(dirname(realpath(__file__))), "scripts", "filesaver_export_worker.py")
+MANIFEST_NAME = "manifest.json"
+
+
+class FilesaverExportPool(BackgroundWorkerPool):
+    """ Exports frames to filesaver format with several background Blender processes """
+    def __init__(self, blendfile, frames, worker_count):
+        super().__init__(blendfile, frames, worker_count, WORKER_SCRIPT, prefix="luxcore_filesaver_")
+
+    def write_manifest(self, scene):
+        """ Describes the exported frames for the render farm """
+        config = scene.luxcore.config
+        output_dir = get_filesaver_dir(scene)
+        share_payloads = config.filesaver_format == "TXT" and config.filesaver_share_payloads
+
+        manifest = {
+            "blend_file": self.blendfile,
+            "format": config.filesaver_format,
+            "shared_dir": join(output_dir, utils_filesaver.SHARED_DIR_NAME) if share_payloads else None,
+            "total_time": time() - self.start_time,
+            "worker_logs": self.temp_dir,
+            "frames": [self.results[frame] for frame in sorted(self.results)],
+            "failed_frames": self.get_failed_frames(),
+        }
+
+        os.makedirs(output_dir, exist_ok=True)
+        path = join(output_dir, MANIFEST_NAME)
+        with open(path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        return path
+
+
+class LUXCORE_OT_export_filesaver_frames(bpy.types.Operator):
+    """
+    Can also be used headless, e.g. on a render farm:
+    blender -b file.blend --python-expr "import bpy; bpy.ops.luxcore.export_filesaver_frames(worker_count=8)"
+    """
+    bl_idname = "luxcore.export_filesaver_frames"
+    bl_label = "Export Frame Range"
+    bl_description = ("Export all frames of the frame range to the filesaver format with several "
+                      "Blender processes in parallel, and write a manifest of the exported frames")
+
+    worker_count: IntProperty(name="Workers", default=0, min=0,
+                              description="Number of parallel Blender processes (0: half the CPU threads)")
+
+    _timer = None
+    _pool = None
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.render.engine == "LUXCORE"
+
+    def invoke(self, context, event):
+        self._pool = self._start_pool(context)
+        if self._pool is None:
+            return {"CANCELLED"}
+
+        self._timer = context.window_manager.event_timer_add(1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self._pool.cancel()
+            self._finish(context)
+            self.report({"WARNING"}, "Filesaver export cancelled")
+            return {"CANCELLED"}
+
+        if event.type == "TIMER":
+            finished = self._update(context)
+            if finished:
+                return self._finish(context)
+
+        return {"PASS_THROUGH"}
+
+    def execute(self, context):
+        # Blocking version for background mode
+        self._pool = self._start_pool(context)
+        if self._pool is None:
+            return {"CANCELLED"}
+
+        while not self._update(context):
+            sleep(1)
+        return self._finish(context)
+
+    def _start_pool(self, context):
+        scene = context.scene
+
+        if not bpy.data.is_saved or bpy.data.is_dirty:
+            self.report({"ERROR"}, "Save the .blend file first, the workers load it from disk")
+            return None
+        if not scene.luxcore.config.filesaver_path:
+            self.report({"ERROR"}, "Set a filesaver output path first")
+            return None
+
+        worker_count = self.worker_count or max(1, os.cpu_count() // 2)
+        frames = list(range(scene.frame_start, scene.frame_end + 1, scene.frame_step))
+        print("[Filesaver Export] Exporting %d frames with %d workers" % (len(frames), worker_count))
+        return FilesaverExportPool(bpy.data.filepath, frames, worker_count)
+
+    def _update(self, context):
+        new_results, finished = self._pool.poll()
+
+        for result in new_results:
+            if result["error"]:
+                print("[Filesaver Export] Frame %d failed: %s" % (result["frame"], result["error"]))
+            else:
+                print("[Filesaver Export] Frame %d exported in %.1f s (worker %d)"
+                      % (result["frame"], result["export_time"], result["worker"]))
+
+        if context.workspace:
+            context.workspace.status_text_set("Filesaver export: %d/%d frames (Esc to cancel)"
+                                              % (len(self._pool.results), len(self._pool.frames)))
+        return finished
+
+    def _finish(self, context):
+        if self._timer:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        if context.workspace:
+            context.workspace.status_text_set(None)
+
+        manifest_path = self._pool.write_manifest(context.scene)
+        failed_frames = self._pool.get_failed_frames()
+
+        if failed_frames:
+            self.report({"ERROR"}, "%d frames failed, see %s" % (len(failed_frames), manifest_path))
+            return {"CANCELLED"}
+
+        self.report({"INFO"}, 'Exported %d frames, manifest: "%s"' % (len(self._pool.frames), manifest_path))
+        return {"FINISHED"}
@@ -1,50 +1,64 @@
 import os
-from random import randint
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import bpy
 from bpy.props import CollectionProperty, StringProperty, BoolProperty
 from bpy.types import OperatorFileListElement
 from bpy_extras.io_utils import ImportHelper
 from bpy_extras.image_utils import load_image
-from mathutils import Vector
 
 from ..nodes import TREE_TYPES
 
 # Blender images always include an alpha channel
 IMAGE_CHANNEL_COUNT = 4
+# Slow normalmap checks that run in the background while the next image is loaded.
+# Limits the number of pixel arrays that are kept in memory at the same time.
+MAX_PENDING_CHECKS = 2
 
 
-def get_normal(pixels, index):
-    # The index is in pixels
-    index *= IMAGE_CHANNEL_COUNT
-    # +3 because we don't want the alpha channel
-    # Note: this call is super slow
-    raw = pixels[index:index + 3]
-    # The vector values (range -1..1) are encoded
-    # in range 0..1, we have to map them back
-    return Vector((value * 2 - 1 for value in raw))
+def read_pixels(image):
+    """
+    Read all pixels of the image into a flat float32 numpy array with one
+    call to foreach_get (much faster than slicing image.pixels).
+    Has to be called from the main thread because it accesses Blender data.
+    """
+    if bpy.app.version < (2, 83, 0):
+        # foreach_get() is not available for image.pixels in older versions
+        return np.array(image.pixels[:], dtype=np.float32)
+
+    width, height = image.size
+    pixels = np.empty(width * height * IMAGE_CHANNEL_COUNT, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels
+
+
+def is_normalmap(pixels, test_pixel_count=4096, max_deviation=0.1):
+    """
+    Check the vector length of a random sample of pixels.
+    If all vectors seem to be normalized, it is most likely a normalmap.
+    """
+    pixel_count = len(pixels) // IMAGE_CHANNEL_COUNT
+    if pixel_count == 0:
+        return False
+
+    rgba = pixels.reshape(pixel_count, IMAGE_CHANNEL_COUNT)
+    indices = np.random.randint(0, pixel_count, size=min(test_pixel_count, pixel_count))
+    # The vector values (range -1..1) are encoded in range 0..1,
+    # we have to map them back. We don't want the alpha channel.
+    normals = rgba[indices, :3] * 2 - 1
+    lengths = np.einsum("ij,ij->i", normals, normals)
+    return bool(np.all(np.abs(lengths - 1) <= max_deviation))
 
 
 def check_for_normalmap_slow(image):
     """
-    Check the vector length of a few pixels in the image.
+    Check the vector length of a random sample of pixels in the image.
     If all vectors seem to be normalized, it is most likely a normalmap.
-    Note: this function is super slow (because of calls to
-    image.size and image.pixels)
+    Note: this function still has to load all pixels of the image,
+    so it takes a bit of time on large images.
     """
-    TEST_PIXEL_COUNT = 20
-    MAX_DEVIATION = 0.1
-    ALLOWED_MIN = 1 - MAX_DEVIATION
-    ALLOWED_MAX = 1 + MAX_DEVIATION
-    # Just assume that the image is at least 100x100
-    pixel_count = image.size[0] * image.size[1]
-
-    for i in range(TEST_PIXEL_COUNT):
-        index = randint(0, pixel_count - 1)
-        normal = get_normal(image.pixels, index)
-        length = normal.length_squared
-        if length < ALLOWED_MIN or length > ALLOWED_MAX:
-            return False
-    return True
+    return is_normalmap(read_pixels(image))
 
 
 class LUXCORE_OT_import_multiple_images(bpy.types.Operator, ImportHelper):
@@ -58,7 +72,7 @@ class LUXCORE_OT_import_multiple_images(bpy.types.Operator, ImportHelper):
                                           description='Check if the filename contains the string "normal"')
     detect_normalmaps_slow: BoolProperty(name="Auto-Detect Normalmaps (slow)", default=False,
                                           description="Check if the image pixels are normalized vectors "
-                                                      "(takes about half a second per 4k image)")
+                                                      "(reads all pixels of each image)")
     files: CollectionProperty(name="File Path", type=OperatorFileListElement)
     directory: StringProperty(subtype='DIR_PATH')
     filter_glob: StringProperty(
@@ -75,6 +89,11 @@ class LUXCORE_OT_import_multiple_images(bpy.types.Operator, ImportHelper):
 
     def execute(self, context):
         location = context.space_data.cursor_location
+        # The pixels have to be read on the main thread (Blender API), but the check
+        # of one image runs in the background while the next image is loaded
+        executor = ThreadPoolExecutor(max_workers=MAX_PENDING_CHECKS)
+        # (node, future) of the slow normalmap checks that are not finished yet
+        pending_checks = deque()
 
         for file_elem in self.files:
             print("Importing image:", file_elem.name)
@@ -92,10 +111,20 @@ class LUXCORE_OT_import_multiple_images(bpy.types.Operator, ImportHelper):
             if image:
                 if self.detect_normalmaps_fast and "normal" in image.name:
                     node.is_normal_map = True
-                elif self.detect_normalmaps_slow and check_for_normalmap_slow(image):
-                    node.is_normal_map = True
+                elif self.detect_normalmaps_slow:
+                    if len(pending_checks) >= MAX_PENDING_CHECKS:
+                        _finish_check(*pending_checks.popleft())
+                    pending_checks.append((node, executor.submit(is_normalmap, read_pixels(image))))
             else:
                 self.report({"ERROR"}, "Failed: " + file_elem.name)
                 print("ERROR: Could not import", filepath)
 
-        return {'FINISHED'}
\ No newline at end of file
+        while pending_checks:
+            _finish_check(*pending_checks.popleft())
+        executor.shutdown()
+
+        return {'FINISHED'}
+
+
+def _finish_check(node, future):
+    node.is_normal_map = future.result()
\ No newline at end of file
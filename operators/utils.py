@@ -1,4 +1,9 @@
 import bpy
+import json
+import os
+import tempfile
+from subprocess import Popen, STDOUT
+from time import time
 from ..nodes import TREE_TYPES, TREE_ICONS
 from .. import utils
 from ..ui import icons
@@ -205,3 +210,64 @@ def use_cycles_material_nodes():
     for mat in bpy.data.materials:
         if mat.use_nodes and mat.node_tree:
             mat.luxcore.use_cycles_nodes = True
+
+
+class BackgroundWorkerPool:
+    """
+    Runs a script on the frames of an animation in several background Blender processes.
+    Each worker loads the saved .blend file and processes every n-th frame, so all
+    workers get a similar mix of light and heavy frames.
+    The script is called with the path of its results file, the script_args and the
+    frames, and appends one JSON line with at least "frame" and "error" per frame.
+    """
+    def __init__(self, blendfile, frames, worker_count, script, script_args=(), prefix="luxcore_workers_"):
+        self.blendfile = blendfile
+        self.frames = frames
+        self.start_time = time()
+        self.temp_dir = tempfile.mkdtemp(prefix=prefix)
+        # [(process, results path)]
+        self.workers = []
+        # {frame: result}
+        self.results = {}
+
+        worker_count = max(1, min(worker_count, len(frames)))
+        for index in range(worker_count):
+            results_path = os.path.join(self.temp_dir, "worker_%d.jsonl" % index)
+            command = [bpy.app.binary_path, "-b", blendfile, "--python", script, "--", results_path]
+            command += [str(arg) for arg in script_args]
+            command += [str(frame) for frame in frames[index::worker_count]]
+
+            with open(os.path.join(self.temp_dir, "worker_%d.log" % index), "w") as log:
+                process = Popen(command, stdout=log, stderr=STDOUT)
+            self.workers.append((process, results_path))
+
+    def poll(self):
+        """ Collects new results, returns a list of them and whether all workers are finished """
+        new_results = []
+
+        for index, (process, results_path) in enumerate(self.workers):
+            if not os.path.exists(results_path):
+                continue
+
+            with open(results_path) as results:
+                for line in results:
+                    # The last line might be incomplete if the worker is writing it right now
+                    if not line.endswith("\n"):
+                        break
+                    result = json.loads(line)
+                    if result["frame"] not in self.results:
+                        result["worker"] = index
+                        self.results[result["frame"]] = result
+                        new_results.append(result)
+
+        finished = all(process.poll() is not None for process, _ in self.workers)
+        return new_results, finished
+
+    def cancel(self):
+        for process, _ in self.workers:
+            if process.poll() is None:
+                process.terminate()
+
+    def get_failed_frames(self):
+        return [frame for frame in self.frames
+                if frame not in self.results or self.results[frame]["error"]]
@@ -503,6 +503,24 @@ class LuxCoreConfig(PropertyGroup):
     ]
     filesaver_format: EnumProperty(name="", items=filesaver_format_items, default="TXT")
     filesaver_path: StringProperty(name="", subtype="DIR_PATH", description="Output path where the scene is saved")
+    filesaver_share_payloads: BoolProperty(name="Share Files Between Frames", default=False,
+                                           description="Move meshes and images into a directory shared by all "
+                                                       "frames, so identical files are stored only once. "
+                                                       "Only for the text format")
+
+    # Checkpoints of final renders
+    use_checkpoints: BoolProperty(name="Save Checkpoints", default=False,
+                                  description="Periodically save the film and render state to disk, "
+                                              "so an interrupted render can be resumed")
+    checkpoint_interval: IntProperty(name="Interval (Minutes)", default=10, min=1,
+                                     description="Time between two checkpoints")
+    checkpoint_path: StringProperty(name="Path", subtype="DIR_PATH",
+                                    description="Directory for the checkpoint files "
+                                                "(if empty, a \"checkpoints\" folder next to the .blend file is used)")
+    resume_from_checkpoint: BoolProperty(name="Resume From Checkpoint", default=False,
+                                         description="If a checkpoint of the frame exists, continue the render "
+                                                     "from it instead of starting a new one. Changes to the scene "
+                                                     "since the checkpoint are ignored")
 
     # Seed
     seed: IntProperty(name="Seed", default=1, min=1, description=SEED_DESC)
@@ -19,6 +19,20 @@ SEARCH_WINDOW_RADIUS_DESC = (
     "Higher values improve the denoiser result, but lead to longer computation time"
 )
 FILTER_SPIKES_DESC = "Filter outliers from the input samples"
+AUTO_REFRESH_DESC = (
+    "Automatically update the denoised image during the final render when the sample count or "
+    "the convergence have improved enough since the last update"
+)
+AUTO_REFRESH_SAMPLE_FACTOR_DESC = (
+    "Update the denoised image when the sample count has grown by this factor since the last update"
+)
+AUTO_REFRESH_CONVERGENCE_STEP_DESC = (
+    "Update the denoised image when the convergence has improved by this amount since the last update"
+)
+AUTO_REFRESH_MAX_OVERHEAD_DESC = (
+    "Limit the share of time spent on automatic updates. The duration of the last update "
+    "determines how long to wait until the next one"
+)
 MAX_MEMORY_DESC = (
     "Approximate maximum amount of memory to use in megabytes (actual memory usage "
     "may be higher). Limiting memory usage may cause slower denoising due to internally "
@@ -36,6 +50,17 @@ class LuxCoreDenoiser(PropertyGroup):
     ]
     type: EnumProperty(name="Type", items=type_items, default="OIDN")
 
+    auto_refresh: BoolProperty(name="Automatic Refresh", default=False,
+                                description=AUTO_REFRESH_DESC)
+    auto_refresh_sample_factor: FloatProperty(name="Sample Growth", default=2, min=1.1, soft_max=4,
+                                               description=AUTO_REFRESH_SAMPLE_FACTOR_DESC)
+    auto_refresh_convergence_step: FloatProperty(name="Convergence Step", default=5, min=0.1, max=100,
+                                                  subtype="PERCENTAGE",
+                                                  description=AUTO_REFRESH_CONVERGENCE_STEP_DESC)
+    auto_refresh_max_overhead: FloatProperty(name="Max. Overhead", default=10, min=1, max=100,
+                                              subtype="PERCENTAGE",
+                                              description=AUTO_REFRESH_MAX_OVERHEAD_DESC)
+
     # BCD settings
     scales: IntProperty(name="Scales", default=3, min=1, soft_max=5,
                          description=SCALES_DESC)
@@ -1,5 +1,5 @@
 import bpy
-from bpy.props import IntProperty, BoolProperty
+from bpy.props import IntProperty, BoolProperty, FloatProperty
 
 
 class LuxCoreDisplaySettings(bpy.types.PropertyGroup):
@@ -8,7 +8,16 @@ class LuxCoreDisplaySettings(bpy.types.PropertyGroup):
     stop_requested = False
 
     interval: IntProperty(name="Refresh Interval (s)", default=10, min=5,
-                           description="Time between film refreshes, in seconds")
+                           description="Time between film refreshes, in seconds. Refreshes are done less "
+                                       "often if they would exceed the max. refresh overhead")
+    max_refresh_overhead: FloatProperty(name="Max. Refresh Overhead", default=10, min=1, max=50,
+                                         subtype="PERCENTAGE",
+                                         description="Share of the render time that may be spent on film "
+                                                     "refreshes and statistics updates. The refresh intervals "
+                                                     "are adapted to the measured cost of these operations")
+    aov_interval: IntProperty(name="AOV Refresh Interval (s)", default=60, min=5,
+                               description="Time between refreshes of AOVs and light groups, in seconds. "
+                                           "All passes are refreshed when the render stops")
 
     show_converged: BoolProperty(name="Highlight Converged Tiles", default=True,
                                   description="Mark tiles that are no longer rendered with green outline")
@@ -72,6 +72,10 @@ def rays_per_sample_to_string(rays_per_sample):
     return "%.1f" % rays_per_sample
 
 
+def percentage_to_string(percentage):
+    return "%.1f%%" % percentage
+
+
 def get_rays_per_sample(stat_props):
     samples_per_sec = stat_props.Get("stats.renderengine.total.samplesec").GetFloat()
     rays = stat_props.Get("stats.renderengine.performance.total").GetFloat()
@@ -186,6 +190,10 @@ class LuxCoreRenderStats:
                                     0, greater_is_better, samples_per_sec_to_string, get_rounded)
         self.rays_per_sample = Stat("Rays/Sample", categories[-1],
                                     0, smaller_is_better, rays_per_sample_to_string, get_rounded)
+        self.refresh_overhead = Stat("Refresh Overhead", categories[-1],
+                                     0, smaller_is_better, percentage_to_string, get_rounded)
+        self.film_refresh_time = Stat("Film Refresh Time", categories[-1],
+                                      0, smaller_is_better, time_to_string, get_rounded)
         categories.append("Startup")
         self.export_time = Stat("Export Time", categories[-1],
                                 0, smaller_is_better, time_to_string, get_rounded)
@@ -30,11 +30,43 @@ class LuxCoreViewportSettings(bpy.types.PropertyGroup):
     mag_filter: EnumProperty(name="Filter", items=mag_filters, default="NEAREST",
                               description="Upscaling filter used when pixel size is larger than 1")
 
+    reuse_scene_on_config_change: BoolProperty(name="Keep Scene on Resize", default=True,
+                                                description="When the viewport is resized or render settings "
+                                                            "are changed, only restart the render instead of "
+                                                            "exporting the whole scene again")
+
+    use_staged_export: BoolProperty(name="Staged Export", default=False,
+                                     description="Start the viewport render with camera, world and lights "
+                                                 "and add the other objects during the following redraws, "
+                                                 "largest on screen first. Keeps the interface responsive "
+                                                 "while large scenes are loading")
+
+    proxy_geometries = [
+        ("NONE", "None", "Objects appear when they are exported", 0),
+        ("BOUNDING_BOX", "Bounding Box", "Show the bounding box of objects that are not exported yet", 1),
+        ("SIMPLIFIED", "Simplified", "Show a simplified version of the mesh without modifiers "
+                                     "for objects that are not exported yet. The base meshes are "
+                                     "converted before the first frame, so it starts slower than with "
+                                     "bounding boxes. If this takes too long, the remaining objects "
+                                     "are shown as bounding boxes", 2),
+    ]
+    proxy_geometry: EnumProperty(name="Proxy", items=proxy_geometries, default="BOUNDING_BOX",
+                                 description="Stand-in geometry that is shown while the staged export is running")
+
+    use_half_float: BoolProperty(name="Half Float Display", default=False,
+                                  description="Upload the viewport image to the GPU with 16 bit floats instead "
+                                              "of 32 bit. Halves the upload bandwidth, which is useful on very "
+                                              "high resolution displays, at the cost of precision")
+
     reduce_resolution_on_edit: BoolProperty(name="Reduce first sample resolution", default=True,
                                              description="Render the first sample after editing the scene "
                                                          "with reduced resolution to provide a quicker response "
                                                          "(does not work when light tracing or bidir are used "
                                                          "for viewport rendering)")
+    use_auto_resolution_reduction: BoolProperty(name="Automatic Block Size", default=False,
+                                                 description="Choose the block size depending on the viewport "
+                                                             "resolution, so large viewports stay responsive "
+                                                             "while the camera or objects are moved")
     resolution_reduction: IntProperty(name="Block Size", default=4, min=2,
                                        description="Size of the startup blocks in pixels. A size of 4 means that "
                                                    "one sample is spread over 4x4 pixels on startup")
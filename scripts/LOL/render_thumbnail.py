@@ -1,11 +1,28 @@
+"""
+Render thumbnails of local library assets.
+
+Usage (started by the local library operators):
+blender studio.blend -b --python render_thumbnail.py -- <blendfile> <samples> <model|material>
+
+Batch mode, renders all assets listed in a text file (one .blend path per line) or all
+.blend files in a directory. Assets whose thumbnail is newer than the .blend file are skipped
+unless --force is given:
+blender studio.blend -b --python render_thumbnail.py -- --batch <listfile|directory> <samples> <model|material> [--force]
+"""
+
 import bpy
 import sys
+import numpy as np
 from os import listdir
-from os.path import isfile, join, basename, dirname, splitext
+from os.path import isdir, isfile, join, basename, dirname, getmtime, splitext
+from time import sleep
 from mathutils import Vector, Matrix
 
 from BlendLuxCore.utils.compatibility import run
 
+LUXBALL_OBJECTS = ['Luxball', 'Luxball ring']
+BACKGROUND_OBJECTS = ['Camera', 'Stage', 'Left Area', 'Right Area', 'Room', 'Top Area', 'Backlight Area']
+
 
 def select(objects):
     bpy.ops.object.select_all(action='DESELECT')
@@ -48,21 +65,12 @@ def render_material_thumbnail(assetname, blendfile, thumbnail, samples):
 
     mat = mat_to.materials[0]
 
-    context.view_layer.objects.active = bpy.data.objects['Luxball']
-    bpy.data.objects['Luxball'].material_slots[0].material = mat
-    context.view_layer.objects.active = bpy.data.objects['Luxball ring']
-    bpy.data.objects['Luxball ring'].material_slots[0].material = mat
+    for name in LUXBALL_OBJECTS:
+        context.view_layer.objects.active = bpy.data.objects[name]
+        bpy.data.objects[name].material_slots[0].material = mat
     run()
 
-    context.scene.view_settings.gamma = 1
-    context.scene.view_settings.exposure = 1
-    context.scene.view_settings.look = 'Very High Contrast'
-    context.scene.luxcore.halt.enable = True
-    context.scene.luxcore.halt.use_samples = True
-    context.scene.luxcore.halt.samples = int(samples)
-    context.scene.render.image_settings.file_format = 'JPEG'
-    context.scene.render.filepath = thumbnail
-
+    setup_render_settings(context.scene, samples, thumbnail)
     bpy.ops.render.render(write_still=True)
 
 
@@ -96,14 +104,7 @@ def render_model_thumbnail(assetname, blendfile, thumbnail, samples):
     
     scale_size = 2 * max(abs(bbox_max[0] - bbox_min[0]), abs(bbox_max[2] - bbox_min[2]))
     
-    background = [
-        bpy.data.objects['Camera'],
-        bpy.data.objects['Stage'],
-        bpy.data.objects['Left Area'],
-        bpy.data.objects['Right Area'],
-        bpy.data.objects['Room'],
-        bpy.data.objects['Top Area'],
-        bpy.data.objects['Backlight Area']]
+    background = [bpy.data.objects[name] for name in BACKGROUND_OBJECTS]
         
     camera = bpy.data.objects['Camera']
         
@@ -124,30 +125,192 @@ def render_model_thumbnail(assetname, blendfile, thumbnail, samples):
     main_object.empty_display_size = 0.5*max(bbox_max[0] - bbox_min[0], bbox_max[1] - bbox_min[1], bbox_max[2] - bbox_min[2])
 
     col.instance_offset = bbox_center
-            
-    context.scene.view_settings.gamma = 1
-    context.scene.view_settings.exposure = 1
-    context.scene.view_settings.look = 'Very High Contrast'
-    context.scene.luxcore.halt.enable = True
-    context.scene.luxcore.halt.use_samples = True
-    context.scene.luxcore.halt.samples = int(samples)
-    context.scene.render.image_settings.file_format = 'JPEG'
-    context.scene.render.filepath = thumbnail
-    
+
+    setup_render_settings(context.scene, samples, thumbnail)
     bpy.ops.render.render(write_still = True)
 
+    return main_object, col, data_to.objects
+
+
+def setup_render_settings(scene, samples, thumbnail):
+    scene.view_settings.gamma = 1
+    scene.view_settings.exposure = 1
+    scene.view_settings.look = 'Very High Contrast'
+    scene.luxcore.halt.enable = True
+    scene.luxcore.halt.use_samples = True
+    scene.luxcore.halt.samples = int(samples)
+    scene.render.image_settings.file_format = 'JPEG'
+    scene.render.filepath = thumbnail
+
+
+def get_thumbnail_path(blendfile):
+    assetname = splitext(basename(blendfile))[0]
+    return join(dirname(dirname(blendfile)), 'preview', 'full', 'local', assetname + ".jpg")
+
+
+def get_outdated_assets(source, force):
+    """ Returns (blendfile, thumbnail) pairs of the assets whose thumbnail is missing or older than the asset """
+    if isdir(source):
+        blendfiles = [join(source, f) for f in sorted(listdir(source)) if f.endswith('.blend')]
+    else:
+        with open(source) as file_handle:
+            blendfiles = [line.strip() for line in file_handle if line.strip()]
+
+    assets = []
+    for blendfile in blendfiles:
+        thumbnail = get_thumbnail_path(blendfile)
+        if not force and isfile(thumbnail) and getmtime(thumbnail) >= getmtime(blendfile):
+            print('Thumbnail of "%s" is up to date, skipping' % blendfile)
+            continue
+        assets.append((blendfile, thumbnail))
+    return assets
+
+
+class MaterialBatchRenderer:
+    """
+    Renders the thumbnails of many materials with one render session. The studio scene is
+    exported once, for each asset only the material of the LuxBall is replaced in a scene edit.
+    """
+    def __init__(self, context, samples):
+        from BlendLuxCore import export, utils
+
+        self.context = context
+        self.samples = int(samples)
+        scene = context.scene
+        setup_render_settings(scene, samples, "")
+        # The sample budget is checked in wait_for_samples(), a halt condition would end the session
+        scene.luxcore.halt.enable = False
+
+        self.exporter = export.Exporter()
+        self.session = self.exporter.create_session(context.evaluated_depsgraph_get())
+
+        # The exported LuxBall objects with the shapes of their parts before any material was applied
+        self.luxball_objects = []
+        for name in LUXBALL_OBJECTS:
+            exported_obj = self.exporter.object_cache2.exported_objects[utils.make_key(bpy.data.objects[name])]
+            self.luxball_objects.append((exported_obj, [part.lux_shape for part in exported_obj.parts]))
+
+        self.width, self.height = utils.calc_filmsize(scene)
+        self.image = bpy.data.images.new("LuxCore Thumbnail", self.width, self.height, float_buffer=True)
+        self.session.Start()
+
+    def render(self, blendfile, thumbnail):
+        from BlendLuxCore.bin import pyluxcore
+        from BlendLuxCore.export import material
+        from BlendLuxCore.export.caches.object_cache import define_shapes
+
+        with bpy.data.libraries.load(blendfile, link=True) as (mat_from, mat_to):
+            mat_to.materials = mat_from.materials
+        mat = mat_to.materials[0]
+        run()
+
+        depsgraph = self.context.evaluated_depsgraph_get()
+        exporter = self.exporter
+        exporter.scene = depsgraph.scene_eval
+        exporter.node_cache.clear()
+
+        props = pyluxcore.Properties()
+        lux_mat_name, mat_props = material.convert(exporter, depsgraph, mat, False)
+        props.Set(mat_props)
+        node_tree = mat.luxcore.node_tree
+
+        for exported_obj, base_shapes in self.luxball_objects:
+            for part, base_shape in zip(exported_obj.parts, base_shapes):
+                part.lux_mat = lux_mat_name
+                if node_tree:
+                    part.lux_shape = define_shapes(base_shape, node_tree, exporter, depsgraph, props)
+                else:
+                    part.lux_shape = base_shape
+            props.Set(exported_obj.get_props())
+        exporter.scene = None
+
+        self.session.BeginSceneEdit()
+        luxcore_scene = self.session.GetRenderConfig().GetScene()
+        luxcore_scene.Parse(props)
+        # Remove the material of the previous asset
+        luxcore_scene.RemoveUnusedMaterials()
+        luxcore_scene.RemoveUnusedTextures()
+        luxcore_scene.RemoveUnusedImageMaps()
+        self.session.EndSceneEdit()
+
+        self.wait_for_samples()
+        self.save(thumbnail)
+        bpy.data.libraries.remove(mat.library)
+
+    def wait_for_samples(self):
+        while True:
+            sleep(0.1)
+            self.session.UpdateStats()
+            if self.session.GetStats().Get("stats.renderengine.pass").GetInt() >= self.samples:
+                return
+
+    def save(self, thumbnail):
+        from BlendLuxCore.bin import pyluxcore
+
+        rgb = np.empty(self.width * self.height * 3, dtype=np.float32)
+        self.session.GetFilm().GetOutputFloat(pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE, rgb)
+        rgba = np.ones((self.width * self.height, 4), dtype=np.float32)
+        rgba[:, :3] = rgb.reshape(-1, 3)
+        if bpy.app.version >= (2, 83, 0):
+            self.image.pixels.foreach_set(rgba.ravel())
+        else:
+            # foreach_set() is not available for image.pixels in older versions
+            self.image.pixels = rgba.ravel().tolist()
+        # Applies the color management of the scene (look etc.) like a regular render would
+        self.image.save_render(thumbnail, scene=self.context.scene)
+        print('Saved thumbnail "%s"' % thumbnail)
+
+    def stop(self):
+        self.session.Stop()
+        self.session = None
+        bpy.data.images.remove(self.image)
+
+
+def render_batch(source, samples, type, force):
+    assets = get_outdated_assets(source, force)
+    print('Rendering %d thumbnails' % len(assets))
+    if not assets:
+        return
+
+    if type == 'material':
+        renderer = MaterialBatchRenderer(bpy.context, samples)
+        try:
+            for blendfile, thumbnail in assets:
+                renderer.render(blendfile, thumbnail)
+        finally:
+            renderer.stop()
+    elif type == 'model':
+        # Each model changes the scale of the studio and the camera height, so it
+        # needs its own session, but the studio is only loaded once
+        initial_matrices = {name: bpy.data.objects[name].matrix_world.copy() for name in BACKGROUND_OBJECTS}
+
+        for blendfile, thumbnail in assets:
+            for name, matrix in initial_matrices.items():
+                bpy.data.objects[name].matrix_world = matrix
+
+            assetname = splitext(basename(blendfile))[0]
+            main_object, col, objects = render_model_thumbnail(assetname, blendfile, thumbnail, samples)
+
+            libraries = {obj.library for obj in objects if obj.library}
+            bpy.data.objects.remove(main_object)
+            bpy.data.collections.remove(col)
+            for library in libraries:
+                bpy.data.libraries.remove(library)
 
 
 argv = sys.argv
 argv = argv[argv.index("--") + 1:]
 
-blendfile = argv[0]
-assetname = splitext(basename(argv[0]))[0]
-thumbnail = join(dirname(dirname(argv[0])), 'preview', 'full', 'local', assetname + ".jpg")
-samples = argv[1]
-type = argv[2]
+if argv[0] == '--batch':
+    render_batch(argv[1], argv[2], argv[3], '--force' in argv[4:])
+else:
+    blendfile = argv[0]
+    assetname = splitext(basename(argv[0]))[0]
+    thumbnail = get_thumbnail_path(blendfile)
+    samples = argv[1]
+    type = argv[2]
 
-if type == 'model':
-    render_model_thumbnail(assetname, blendfile, thumbnail, samples)
-elif type == 'material':
-    render_material_thumbnail(assetname, blendfile, thumbnail, samples)
\ No newline at end of file
+    if type == 'model':
+        render_model_thumbnail(assetname, blendfile, thumbnail, samples)
+    elif type == 'material':
+        render_material_thumbnail(assetname, blendfile, thumbnail, samples)
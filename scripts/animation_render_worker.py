@@ -0,0 +1,54 @@
+"""
+Worker process of the parallel animation render (see operators/animation.py).
+Renders the given frames of the opened .blend file with a fixed number of CPU threads,
+writes them to the output path of the scene and appends one JSON line per frame to
+the results file.
+
+Usage:
+blender -b <file.blend> --python animation_render_worker.py -- <results file> <threads> <frame> [<frame> ...]
+"""
+
+import bpy
+import json
+import os
+import sys
+from time import time
+
+argv = sys.argv[sys.argv.index("--") + 1:]
+results_path = argv[0]
+threads = int(argv[1])
+frames = [int(frame) for frame in argv[2:]]
+
+scene = bpy.context.scene
+render = scene.render
+# Used as native.threads.count by the config export
+render.threads_mode = "FIXED"
+render.threads = threads
+
+with open(results_path, "a") as results:
+    for frame in frames:
+        output_path = render.frame_path(frame=frame)
+        result = {
+            "frame": frame,
+            "path": output_path,
+            "render_time": 0,
+            "skipped": False,
+            "error": None,
+        }
+
+        if not render.use_overwrite and os.path.exists(output_path):
+            # Same behaviour as rendering the animation in Blender
+            result["skipped"] = True
+        else:
+            scene.frame_set(frame)
+            start = time()
+            bpy.ops.render.render(write_still=True)
+            result["render_time"] = time() - start
+
+            # With overwrite enabled, the file of an earlier render might still exist
+            if not os.path.exists(output_path) or os.path.getmtime(output_path) < start:
+                result["error"] = "Render failed (check the worker log)"
+
+        results.write(json.dumps(result) + "\n")
+        # The main process reads the results while the render is running
+        results.flush()
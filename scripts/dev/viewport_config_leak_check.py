@@ -0,0 +1,100 @@
+"""
+Leak regression check for viewport config changes without re-export
+(see Exporter.create_session_for_config_change() and https://github.com/LuxCoreRender/BlendLuxCore/issues/577).
+
+Repeatedly creates a new RenderConfig/RenderSession with a different film size for the
+same exported scene, like a viewport resize does, and checks that the memory usage of
+the process stays bounded.
+
+Usage (the addon has to be installed):
+blender -b --python scripts/dev/viewport_config_leak_check.py -- [iterations] [max growth in MiB]
+"""
+
+import sys
+from time import sleep
+
+from BlendLuxCore.bin import pyluxcore
+from BlendLuxCore.export import create_session_for_scene
+
+WARMUP_ITERATIONS = 10
+
+
+def get_rss_mib():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+
+    # Linux only fallback
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    import resource
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def create_scene():
+    scene = pyluxcore.Scene()
+    props = pyluxcore.Properties()
+    props.SetFromString("""
+        scene.camera.type = "perspective"
+        scene.camera.lookat.orig = 0 -5 1
+        scene.camera.lookat.target = 0 0 0
+        scene.materials.mat.type = "matte"
+        scene.lights.sky.type = "sky2"
+    """)
+    scene.Parse(props)
+    scene.DefineMesh("plane", [(-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0)], [(0, 1, 2), (2, 3, 0)],
+                     None, None, None, None)
+    props = pyluxcore.Properties()
+    props.Set(pyluxcore.Property("scene.objects.plane.shape", "plane"))
+    props.Set(pyluxcore.Property("scene.objects.plane.material", "mat"))
+    scene.Parse(props)
+    return scene
+
+
+def config_props(width, height):
+    props = pyluxcore.Properties()
+    props.Set(pyluxcore.Property("renderengine.type", "RTPATHCPU"))
+    props.Set(pyluxcore.Property("sampler.type", "RTPATHCPUSAMPLER"))
+    props.Set(pyluxcore.Property("film.width", width))
+    props.Set(pyluxcore.Property("film.height", height))
+    props.Set(pyluxcore.Property("film.imagepipelines.0.0.type", "TONEMAP_AUTOLINEAR"))
+    return props
+
+
+def main(iterations, max_growth_mib):
+    # Note: pyluxcore.Init() was already called when the addon was registered
+    scene = create_scene()
+    session = None
+    baseline = None
+
+    for i in range(iterations):
+        if session:
+            session.Stop()
+            del session
+        # Alternate between two sizes like a resize back and forth
+        width, height = (640, 480) if i % 2 else (800, 600)
+        session = create_session_for_scene(scene, config_props(width, height))
+        session.Start()
+        sleep(0.1)
+
+        if i == WARMUP_ITERATIONS:
+            baseline = get_rss_mib()
+
+    session.Stop()
+    del session
+
+    growth = get_rss_mib() - baseline
+    print("RSS growth after %d config changes: %.1f MiB (limit %.1f MiB)"
+          % (iterations - WARMUP_ITERATIONS, growth, max_growth_mib))
+    if growth > max_growth_mib:
+        raise AssertionError("Memory usage grew by %.1f MiB, possible leak" % growth)
+    print("OK")
+
+
+if __name__ == "__main__":
+    args = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    iterations = int(args[0]) if args else 200
+    max_growth_mib = float(args[1]) if len(args) > 1 else 50
+    main(max(iterations, WARMUP_ITERATIONS + 1), max_growth_mib)
@@ -0,0 +1,61 @@
+"""
+Worker process of the parallel filesaver export (see operators/filesaver.py).
+Exports the given frames of the opened .blend file and appends one JSON line
+per frame to the results file.
+
+Usage:
+blender -b <file.blend> --python filesaver_export_worker.py -- <results file> <frame> [<frame> ...]
+"""
+
+import bpy
+import json
+import os
+import sys
+from time import time
+
+from BlendLuxCore.export.config import get_filesaver_frame_path
+
+# Files written by LuxCore for a text format export
+TXT_FILE_NAMES = ("render.cfg", "scene.scn")
+
+
+def is_exported(path, start_time):
+    """ The frame directory is created before the export, so check the files that LuxCore writes """
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in TXT_FILE_NAMES]
+    else:
+        files = [path]
+    # Files of an earlier export might still exist
+    return all(os.path.isfile(file) and os.path.getmtime(file) >= start_time for file in files)
+
+
+argv = sys.argv[sys.argv.index("--") + 1:]
+results_path = argv[0]
+frames = [int(frame) for frame in argv[1:]]
+
+scene = bpy.context.scene
+scene.luxcore.config.use_filesaver = True
+
+with open(results_path, "a") as results:
+    for frame in frames:
+        scene.frame_set(frame)
+
+        start = time()
+        bpy.ops.render.render()
+        export_time = time() - start
+
+        # Without multiple view layers, the path does not depend on the layer
+        layers = [layer for layer in scene.view_layers if layer.use]
+        paths = list(dict.fromkeys(get_filesaver_frame_path(scene, layer) for layer in layers))
+        exported = all(is_exported(path, start) for path in paths)
+        error = None if exported else "Export failed (check the worker log)"
+
+        result = {
+            "frame": frame,
+            "paths": paths,
+            "export_time": export_time,
+            "error": error,
+        }
+        results.write(json.dumps(result) + "\n")
+        # The main process reads the results while the export is running
+        results.flush()
@@ -45,6 +45,8 @@ class LUXCORE_IMAGE_PT_display(Panel, LuxCoreImagePanel):
         template_refresh_button(LuxCoreDisplaySettings.refresh, "luxcore.request_display_refresh",
                                 layout, "Refreshing film...")
         layout.prop(display, "interval")
+        layout.prop(display, "max_refresh_overhead")
+        layout.prop(display, "aov_interval")
 
         if config.engine == "PATH" and config.use_tiles:
             col = layout.column(align=True)
@@ -84,6 +86,12 @@ class LUXCORE_IMAGE_PT_denoiser(Panel, LuxCoreImagePanel):
         sub.enabled = denoiser.enabled
         template_refresh_button(LuxCoreDenoiser.refresh, "luxcore.request_denoiser_refresh",
                                 sub, "Running denoiser...")
+        sub.prop(denoiser, "auto_refresh")
+        col = sub.column(align=True)
+        col.enabled = denoiser.auto_refresh
+        col.prop(denoiser, "auto_refresh_sample_factor")
+        col.prop(denoiser, "auto_refresh_convergence_step")
+        col.prop(denoiser, "auto_refresh_max_overhead")
 
         col = layout.column()
         col.label(text="Change the pass to see the result", icon=icons.INFO)
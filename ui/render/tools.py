@@ -27,6 +27,7 @@ class LUXCORE_RENDER_PT_tools(Panel, RenderButtonsPanel):
         op.url = "https://wiki.luxcorerender.org/BlendLuxCore_Network_Rendering"
 
         layout.operator("luxcore.convert_to_v23")
+        layout.operator("luxcore.render_animation_parallel")
 
 
 class LUXCORE_RENDER_PT_filesaver(RenderButtonsPanel, Panel):
@@ -53,3 +54,35 @@ class LUXCORE_RENDER_PT_filesaver(RenderButtonsPanel, Panel):
         col = layout.column(align=True)
         col.prop(config, "filesaver_format")
         col.prop(config, "filesaver_path")
+
+        col = layout.column(align=True)
+        col.enabled = config.filesaver_format == "TXT"
+        col.prop(config, "filesaver_share_payloads")
+
+        layout.operator("luxcore.export_filesaver_frames")
+
+
+class LUXCORE_RENDER_PT_checkpoints(RenderButtonsPanel, Panel):
+    COMPAT_ENGINES = {"LUXCORE"}
+    bl_label = "LuxCore Checkpoints"
+    bl_options = {"DEFAULT_CLOSED"}
+    bl_parent_id = "LUXCORE_RENDER_PT_tools"
+
+    def draw_header(self, context):
+        layout = self.layout
+        config = context.scene.luxcore.config
+        layout.prop(config, "use_checkpoints", text="")
+
+    def draw(self, context):
+        layout = self.layout
+        config = context.scene.luxcore.config
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        col = layout.column(align=True)
+        col.enabled = config.use_checkpoints
+        col.prop(config, "checkpoint_interval")
+        col.prop(config, "checkpoint_path")
+
+        layout.prop(config, "resume_from_checkpoint")
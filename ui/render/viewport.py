@@ -104,7 +104,10 @@ class LUXCORE_RENDER_PT_viewport_settings_advanced(RenderButtonsPanel, Panel):
 
         col = layout.column(align=True)
         col.enabled = viewport.reduce_resolution_on_edit and resolution_reduction_supported
-        col.prop(viewport, "resolution_reduction")
+        col.prop(viewport, "use_auto_resolution_reduction")
+        sub = col.column(align=True)
+        sub.enabled = not viewport.use_auto_resolution_reduction
+        sub.prop(viewport, "resolution_reduction")
 
         col = layout.column(align=True)
         col.prop(viewport, "pixel_size")
@@ -112,3 +115,11 @@ class LUXCORE_RENDER_PT_viewport_settings_advanced(RenderButtonsPanel, Panel):
         col = layout.column(align=True)
         col.enabled = viewport.pixel_size != "1"
         col.prop(viewport, "mag_filter")
+
+        col = layout.column(align=True)
+        col.prop(viewport, "use_half_float")
+        col.prop(viewport, "reuse_scene_on_config_change")
+        col.prop(viewport, "use_staged_export")
+        sub = col.column(align=True)
+        sub.enabled = viewport.use_staged_export
+        sub.prop(viewport, "proxy_geometry")
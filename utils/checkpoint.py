@@ -0,0 +1,110 @@
+"""
+Periodic checkpoints of final renders.
+
+A checkpoint is a LuxCore resume file (.rsm) that contains the film, the sampler state,
+the render config and the scene. It is written by a background thread while the render
+runs, so the refresh loop is not blocked by the disk writes. A render can be continued
+from its checkpoint later, the samples are accumulated on top of the saved film.
+"""
+
+import os
+import threading
+from time import time
+import bpy
+from ..bin import pyluxcore
+from .. import utils
+
+CHECKPOINT_EXTENSION = ".rsm"
+# Used next to the .blend file if no checkpoint path is set. Not a temporary directory,
+# the checkpoints have to survive a restart of the machine.
+DEFAULT_DIR_NAME = "checkpoints"
+
+
+def get_checkpoint_path(scene, view_layer=None):
+    """
+    One checkpoint per .blend file, frame and view layer.
+    Returns None if no checkpoint path is set and the .blend file was never saved.
+    """
+    config = scene.luxcore.config
+    if config.checkpoint_path:
+        output_dir = utils.get_abspath(config.checkpoint_path)
+    elif bpy.data.is_saved:
+        output_dir = os.path.join(os.path.dirname(bpy.data.filepath), DEFAULT_DIR_NAME)
+    else:
+        return None
+
+    blend_name = utils.get_blendfile_name()
+    if not blend_name:
+        blend_name = "Untitled"
+
+    name = "%s_%05d" % (blend_name, scene.frame_current)
+    if len(scene.view_layers) > 1 and view_layer:
+        name += "_" + bpy.path.clean_name(view_layer.name)
+    return os.path.join(output_dir, name + CHECKPOINT_EXTENSION)
+
+
+def find_checkpoint(scene, view_layer=None):
+    """ Returns the path of the checkpoint to resume from, or None """
+    config = scene.luxcore.config
+    if not config.resume_from_checkpoint or config.use_filesaver:
+        return None
+
+    path = get_checkpoint_path(scene, view_layer)
+    return path if path and os.path.isfile(path) else None
+
+
+def load_session(path, exporter, depsgraph, engine):
+    """ Create a session that continues the render saved in the checkpoint """
+    config, start_state, start_film = pyluxcore.RenderConfig.LoadResumeFile(path)
+    exporter.init_resumed_config(depsgraph, engine, config)
+    return pyluxcore.RenderSession(config, start_state, start_film)
+
+
+class CheckpointWriter(threading.Thread):
+    """
+    Saves the resume file of a running session every interval seconds. The file is
+    written under a temporary name and then renamed, so the last complete checkpoint
+    is never replaced by a partially written one.
+    """
+    def __init__(self, session, path, interval, film_lock):
+        super().__init__(daemon=True)
+        self.session = session
+        # Shared with the film readback, see FrameBufferFinal.film_lock
+        self.film_lock = film_lock
+        self.path = path
+        self.interval = interval
+        self.save_count = 0
+        self.last_save_duration = 0
+        self._stop_event = threading.Event()
+        # Serializes the periodic save and the final save in stop()
+        self._lock = threading.Lock()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.save()
+
+    def save(self):
+        with self._lock:
+            directory, name = os.path.split(self.path)
+            temp_path = os.path.join(directory, "." + name)
+            start = time()
+
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with self.film_lock:
+                    self.session.SaveResumeFile(temp_path)
+                os.replace(temp_path, self.path)
+            except Exception as error:
+                print('[Checkpoint] Could not save "%s": %s' % (self.path, error))
+                return
+
+            self.save_count += 1
+            self.last_save_duration = time() - start
+            print('[Checkpoint] Saved "%s" in %.1f s' % (self.path, self.last_save_duration))
+
+    def stop(self, final_save=True):
+        """ Wait for a running save to finish, then optionally save the final state """
+        self._stop_event.set()
+        self.join()
+        if final_save:
+            self.save()
@@ -0,0 +1,98 @@
+"""
+Content-addressed storage for filesaver exports of animations.
+
+The FILESAVER engine writes all meshes and images of the scene into every frame directory,
+even if they did not change between frames. deduplicate_frame() moves these payload files
+into a directory that is shared by all frames, named after the hash of their content, and
+rewrites the references in the scene files of the frame. Only text format exports can be
+processed this way, the binary format is one opaque file per frame.
+"""
+
+import hashlib
+import os
+import re
+
+SHARED_DIR_NAME = "shared"
+# Files that describe the frame itself, everything else in the frame directory is a payload
+SCENE_FILE_EXTENSIONS = {".cfg", ".scn"}
+HASH_BLOCK_SIZE = 1 << 20
+
+_QUOTED_REGEX = re.compile(r'"([^"]*)"')
+
+
+def hash_file(path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        block = file.read(HASH_BLOCK_SIZE)
+        while block:
+            file_hash.update(block)
+            block = file.read(HASH_BLOCK_SIZE)
+    return file_hash.hexdigest()
+
+
+def get_shared_dir(frame_dir):
+    """ The shared directory is located next to the frame directories """
+    return os.path.join(os.path.dirname(os.path.normpath(frame_dir)), SHARED_DIR_NAME)
+
+
+def deduplicate_frame(frame_dir, shared_dir=None):
+    """
+    Move the payloads of a text format frame export into the shared directory and
+    point the scene files to them. Returns (payload count, bytes saved).
+    """
+    if shared_dir is None:
+        shared_dir = get_shared_dir(frame_dir)
+    os.makedirs(shared_dir, exist_ok=True)
+
+    # {file name in the frame directory: path in the shared directory}
+    moved = {}
+    saved_bytes = 0
+
+    for name in sorted(os.listdir(frame_dir)):
+        path = os.path.join(frame_dir, name)
+        extension = os.path.splitext(name)[1].lower()
+        if not os.path.isfile(path) or extension in SCENE_FILE_EXTENSIONS:
+            continue
+
+        shared_path = os.path.join(shared_dir, hash_file(path) + extension)
+        if os.path.exists(shared_path):
+            # Already written by another frame
+            saved_bytes += os.path.getsize(path)
+            os.remove(path)
+        else:
+            # Atomic, so it is safe if another export process moves the same content at the same time
+            os.replace(path, shared_path)
+        moved[name] = shared_path
+
+    if moved:
+        for name in os.listdir(frame_dir):
+            if os.path.splitext(name)[1].lower() in SCENE_FILE_EXTENSIONS:
+                _rewrite_references(os.path.join(frame_dir, name), frame_dir, moved)
+
+    return len(moved), saved_bytes
+
+
+def _rewrite_references(scene_file, frame_dir, moved):
+    """ Replace quoted paths to moved payloads. Relative paths stay relative to the frame directory. """
+    frame_dir = os.path.normpath(frame_dir)
+
+    def replace(match):
+        value = match.group(1)
+        directory, name = os.path.split(value)
+        if name not in moved:
+            return match.group(0)
+
+        if os.path.isabs(value):
+            if os.path.normpath(directory) != frame_dir:
+                return match.group(0)
+            new_path = moved[name]
+        elif directory:
+            return match.group(0)
+        else:
+            new_path = os.path.relpath(moved[name], frame_dir)
+        return '"%s"' % new_path.replace("\\", "/")
+
+    with open(scene_file) as file:
+        text = file.read()
+    with open(scene_file, "w") as file:
+        file.write(_QUOTED_REGEX.sub(replace, text))
@@ -1,5 +1,5 @@
 import math
-from . import calc_filmsize
+from time import time
 from .. import utils
 from ..handlers.draw_imageeditor import TileStats
 from ..properties.statistics import (
@@ -148,6 +148,7 @@ def update_status_msg(stats, engine, scene, config, time_until_film_refresh):
         TileStats.converged_passcounts = stats.Get('stats.tilepath.tiles.converged.pass').GetInts()
         TileStats.notconverged_coords = stats.Get('stats.tilepath.tiles.notconverged.coords').GetInts()
         TileStats.notconverged_passcounts = stats.Get('stats.tilepath.tiles.notconverged.pass').GetInts()
+        TileStats.version += 1
 
 
 def get_pretty_stats(config, stats, scene, context=None):
@@ -237,12 +238,118 @@ def get_pretty_stats(config, stats, scene, context=None):
     return " | ".join(pretty)
 
 
-def shortest_display_interval(scene):
-    # Magic formula to compute shortest possible display interval (found through testing).
-    # If the interval is any shorter, the CPU won't be able to keep up.
-    # Only used for final renders.
-    width, height = calc_filmsize(scene)
-    return (width * height) / 852272.0 * 1.1
+class RefreshScheduler:
+    """
+    Decides when the final render loop updates the stats and refreshes the film.
+    The cost of these operations is measured, and their intervals are chosen so
+    the time spent on them stays below the overhead share set in the display settings.
+    Only used for final renders.
+    """
+    # The loop has to poll at least this often to react to pause/stop requests and scene edits
+    POLL_INTERVAL = 1 / 5
+    # Stats have to be checked regularly to see if a halt condition is met
+    MIN_STATS_INTERVAL = 0.5
+    MAX_STATS_INTERVAL = 16
+    MIN_FILM_INTERVAL = POLL_INTERVAL
+    # Weight of a new measurement in the cost estimate (exponential moving average)
+    COST_SMOOTHING = 0.5
+
+    def __init__(self, scene, statistics):
+        display = scene.luxcore.display
+        self.start = time()
+        self.user_film_interval = display.interval
+        # Every scheduled task gets an equal share of the overhead budget
+        self._budget = display.max_refresh_overhead / 100 / 2
+        self._statistics = statistics
+        self._halt = utils.get_halt_conditions(scene)
+
+        # Estimated cost of one run, in seconds
+        self._costs = {"stats": 0, "film": 0}
+        self._total_overhead = 0
+        self.last_stats_refresh = 0
+        self.last_film_refresh = 0
+        # Time at which a halt condition is expected to be met
+        self._halt_deadline = float("inf")
+
+    def add_cost(self, task, seconds, estimate=True):
+        """
+        Add the measured duration of a task to the overhead. If estimate is True,
+        the measurement is also used for the cost estimate of future runs of
+        scheduled tasks. Other tasks (e.g. the denoiser) only count as overhead.
+        """
+        self._total_overhead += seconds
+        if estimate and task in self._costs:
+            old = self._costs[task]
+            self._costs[task] = seconds if old == 0 else old + (seconds - old) * self.COST_SMOOTHING
+
+        elapsed = time() - self.start
+        if elapsed > 0:
+            self._statistics.refresh_overhead.value = self._total_overhead / elapsed * 100
+        if task == "film":
+            self._statistics.film_refresh_time.value = self._costs["film"]
+
+    def stats_interval(self):
+        interval = self._costs["stats"] / self._budget
+        return min(max(interval, self.MIN_STATS_INTERVAL), self.MAX_STATS_INTERVAL)
+
+    def film_interval(self, now):
+        # Refresh often at the beginning, so the user quickly sees the first samples
+        wanted = min(self.user_film_interval, max(now - self.start, self.MIN_FILM_INTERVAL))
+        return max(wanted, self._costs["film"] / self._budget)
+
+    def time_until_stats_refresh(self, now):
+        next_refresh = min(self.last_stats_refresh + self.stats_interval(), self._halt_deadline)
+        return next_refresh - now
+
+    def time_until_film_refresh(self, now):
+        return self.last_film_refresh + self.film_interval(now) - now
+
+    def stats_done(self, now, stats):
+        self.last_stats_refresh = now
+        # If the prediction was wrong, don't check the stats in every loop iteration
+        self._halt_deadline = max(self._predict_halt(now, stats), now + self.MIN_STATS_INTERVAL)
+
+    def film_done(self, now):
+        self.last_film_refresh = now
+
+    def sleep_time(self, now):
+        until_next = min(self.time_until_stats_refresh(now), self.time_until_film_refresh(now))
+        return min(max(until_next, 0.01), self.POLL_INTERVAL)
+
+    def _predict_halt(self, now, stats):
+        """
+        Predict when a halt condition might be met, so the stats are checked right then.
+        The noise threshold can't be predicted, but it is only tested in certain intervals.
+        """
+        halt = self._halt
+        if not halt.enable:
+            return float("inf")
+
+        deadline = float("inf")
+        rendered_time = stats.Get("stats.renderengine.time").GetFloat()
+
+        if halt.use_time:
+            deadline = now + halt.time - rendered_time
+
+        samples = stats.Get("stats.renderengine.pass").GetInt()
+        samples_per_sec = samples / rendered_time if rendered_time > 0 else 0
+        if samples_per_sec <= 0:
+            return deadline
+
+        if halt.use_samples:
+            deadline = min(deadline, now + (halt.samples - samples) / samples_per_sec)
+
+        if halt.use_noise_thresh:
+            # The noise is tested after the warmup, and then every noise_thresh_step samples
+            warmup = halt.noise_thresh_warmup
+            if samples < warmup:
+                next_test = warmup
+            else:
+                step = halt.noise_thresh_step
+                next_test = warmup + ((samples - warmup) // step + 1) * step
+            deadline = min(deadline, now + (next_test - samples) / samples_per_sec)
+
+        return deadline
 
 
 def find_suggested_clamp_value(session, scene=None):